@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Offline benchmarks for donnie's hot paths.
+
+    python benchmarks/bench.py --out bench.json
+    python benchmarks/bench.py --compare old.json new.json
+
+Uses mongomock unless '--mongo mongodb://localhost' points at a mongod.
+Results are saved as json so runs from different commits can be compared.
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from donnie.tools import (np, pd, updateChartData, updateTradeHistData,
+                          updateLendingHistData, getChartDataFrame,
+                          zoomOHLC, addIndicators, DAY, MINUTE)
+from donnie.cache import ChartCache
+from donnie.brain import Brain
+from donnie.book import OrderBook
+
+from fakes import FakeREST, OfflinePoloniex, tickerStream, getMongo
+import importtime
+
+
+def timeit(func, repeat=3):
+    """ Returns the best of <repeat> runs of <func> in seconds """
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def benchTicker(db, scale):
+    """ on_ticker/checkMarketStops ticks per second as stops grow """
+    rest = FakeREST()
+    ticks = list(tickerStream(rest, 20000 * scale))
+    out = {}
+    for stops in (0, 10, 100, 1000, 10000):
+        polo = OfflinePoloniex(rest, db)
+        base = rest.returnTicker()
+        for i in range(stops):
+            market = rest.markets[i % len(rest.markets)]
+            last = float(base[market]['last'])
+            # far from the price so nothing triggers
+            if i % 2:
+                polo.addStopLimit(market, -1, last * 0.5, last * 0.49,
+                                  test=True)
+            else:
+                polo.addStopLimit(market, 1, last * 2, last * 2.01,
+                                  test=True)
+
+        def run():
+            for msg in ticks:
+                polo.on_ticker(msg)
+        out['stops_%d' % stops] = len(ticks) / timeit(run)
+    return {'ticks_per_sec': out}
+
+
+def benchWrites(db, scale):
+    """ update*Data rows written per second """
+    rest = FakeREST()
+    end = time()
+    out = {}
+    candles = rest.returnChartData('BTC_C000', start=end - 50000 * scale *
+                                   MINUTE * 5, end=end)
+    trades = rest.returnTradeHistory('BTC_C000', end - DAY * 30, end,
+                                     n=20000 * scale)
+    lending = rest.returnLendingHistory(end - DAY * 30, end, n=20000 * scale)
+    for name, update, data in (('chart', updateChartData, candles),
+                               ('trades', updateTradeHistData, trades),
+                               ('lending', updateLendingHistData, lending)):
+        col = db['bench-' + name]
+        col.drop()
+        rows = [dict(row) for row in data]
+        start = perf_counter()
+        update(col, rows, progress=False)
+        out[name] = len(rows) / (perf_counter() - start)
+    return {'rows_per_sec': out}
+
+
+def loadFrame(col, cache=None):
+    """ getChartDataFrame that raises instead of returning False """
+    df = getChartDataFrame(col, 0, cache=cache)
+    if not isinstance(df, pd.DataFrame):
+        raise RuntimeError('getChartDataFrame(%s) failed' % col.name)
+    return df
+
+
+def benchLoad(db, scale):
+    """ getChartDataFrame seconds as the history grows, mongo and cache """
+    rest = FakeREST()
+    end = time()
+    out = {'mongo': {}, 'cache': {}}
+    for size in (1000, 10000, 100000 * scale):
+        col = db['bench-load-%d' % size]
+        col.drop()
+        updateChartData(col, rest.returnChartData(
+            'BTC_C000', start=end - size * MINUTE * 5, end=end),
+            batch=5000, progress=False)
+        out['mongo'][str(size)] = timeit(lambda: loadFrame(col))
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ChartCache(tmp)
+            cache.sync(col)
+            out['cache'][str(size)] = timeit(
+                lambda: loadFrame(col, cache=cache))
+    return {'load_seconds': out}
+
+
+def chartFrame(size):
+    rest = FakeREST()
+    end = time()
+    df = pd.DataFrame(rest.returnChartData(
+        'BTC_C000', start=end - size * MINUTE * 5, end=end))
+    df['_id'] = df['date']
+    df['date'] = pd.to_datetime(df['_id'], unit='s')
+    return df.set_index('_id')
+
+
+def benchFrames(db, scale):
+    """ zoomOHLC and addIndicators seconds """
+    df = chartFrame(100000 * scale)
+    indica = {'RSI': {'period': 14}, 'EMA': {'period': 9},
+              'MACD': {}, 'BBANDS': {}}
+    return {'zoom_seconds': timeit(lambda: zoomOHLC(df.copy(), '1H')),
+            'indicators_seconds': timeit(
+                lambda: addIndicators(df, **indica))}
+
+
+def benchBook(db, scale):
+    """ OrderBook diffs/sec and depth queries/sec, idle and during diffs """
+    rs = np.random.RandomState(666)
+    out = {}
+    for levels in (100, 1000, 10000):
+        book = OrderBook('BTC_C000')
+        asks = 1 + np.arange(1, levels + 1) * 1e-4
+        bids = 1 - np.arange(1, levels + 1) * 1e-4
+        book.update(['i', {'orderBook': [
+            dict(zip(asks.tolist(), rs.uniform(1, 10, levels).tolist())),
+            dict(zip(bids.tolist(), rs.uniform(1, 10, levels).tolist()))]}])
+        # diffs near the touch like the live feed sends
+        diffs = [['o', int(side), str(round(1 + (1 - 2 * side) * lvl * 1e-4,
+                                             8)), str(size)]
+                 for side, lvl, size in zip(
+                     rs.randint(0, 2, 20000 * scale).tolist(),
+                     rs.randint(1, 20, 20000 * scale).tolist(),
+                     rs.choice([0, 1.5, 3.0], 20000 * scale).tolist())]
+        deep = float(asks[-1])
+
+        def applyDiffs():
+            for diff in diffs:
+                book.update(diff)
+
+        def idle():
+            for _ in range(len(diffs)):
+                book.depth('asks', deep)
+
+        def mixed():
+            for diff in diffs:
+                book.update(diff)
+                book.depth('asks', deep)
+                book.vwap('bids', 10.0)
+
+        out[str(levels)] = {
+            'diffs_per_sec': len(diffs) / timeit(applyDiffs),
+            'idle_queries_per_sec': len(diffs) / timeit(idle),
+            'mixed_per_sec': len(diffs) / timeit(mixed)}
+    return {'book': out}
+
+
+def benchBrain(db, scale):
+    """ Brain.train seconds and predict latency """
+    rs = np.random.RandomState(666)
+    x = pd.DataFrame(rs.normal(size=(20000 * scale, 10)))
+    x['label'] = (x[0] + rs.normal(size=len(x)) > 0).astype(int)
+    brain = Brain()
+    train = timeit(lambda: brain.train(x.copy()), repeat=1)
+    row = x.drop('label', axis=1).tail(1)
+    predict = []
+    for _ in range(200):
+        start = perf_counter()
+        brain.predict(row)
+        predict.append(perf_counter() - start)
+    for _ in range(200):
+        brain.predictRows(row.values[0])
+    return {'train_seconds': train,
+            'predict_p50': float(np.percentile(predict, 50)),
+            'predict_p99': float(np.percentile(predict, 99)),
+            'predictRows_p50': brain.latencyStats()['p50'],
+            'predictRows_p99': brain.latencyStats()['p99']}
+
+
+def benchImports(db, scale):
+    """ Import seconds of the light entry points """
+    results, failures = importtime.run()
+    return {'import_seconds': {k: v['seconds'] for k, v in results.items()},
+            'failures': failures}
+
+
+BENCHES = {'imports': benchImports,
+           'ticker': benchTicker,
+           'writes': benchWrites,
+           'load': benchLoad,
+           'frames': benchFrames,
+           'book': benchBook,
+           'brain': benchBrain}
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def run(names, mongo=None, scale=1):
+    db = getMongo(mongo)['donnie-bench']
+    results = {}
+    for name in names:
+        print('Running %s...' % name)
+        try:
+            results[name] = BENCHES[name](db, scale)
+        except Exception as e:
+            results[name] = {'error': repr(e)}
+        print(json.dumps(results[name], indent=2))
+    return {'commit': commit(), 'time': time(),
+            'python': platform.python_version(),
+            'mongo': 'mongod' if mongo else 'mongomock',
+            'results': results}
+
+
+def flatten(d, prefix=''):
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(flatten(v, prefix + k + '.'))
+        else:
+            out[prefix + k] = v
+    return out
+
+
+def compare(old, new):
+    """ Prints new/old ratios of every shared metric """
+    a = flatten(old['results'])
+    b = flatten(new['results'])
+    print('%-45s %14s %14s %8s' % ('metric', old['commit'], new['commit'],
+                                   'ratio'))
+    for k in sorted(set(a) & set(b)):
+        if isinstance(a[k], (int, float)) and a[k]:
+            print('%-45s %14.6g %14.6g %8.2f' % (k, a[k], b[k], b[k] / a[k]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('benches', nargs='*', default=list(BENCHES),
+                        help='benchmarks to run (%s)' % ', '.join(BENCHES))
+    parser.add_argument('--out', help='save results to this json file')
+    parser.add_argument('--mongo', help='mongodb uri, default is mongomock')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='multiply data sizes')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            compare(json.load(a), json.load(b))
+    else:
+        results = run(args.benches, args.mongo, args.scale)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=4)
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Offline stand-ins for the poloniex REST api, the ticker websocket and
+mongodb used by the benchmarks
+"""
+import random
+from itertools import count
+
+from donnie.tools import MINUTE, DAY, epoch2UTCstr, np
+from donnie.poloapi import Poloniex
+
+
+def fakeMarkets(n=100):
+    """ Returns <n> fake market names """
+    return ['BTC_C%03d' % i for i in range(n)]
+
+
+class FakeREST(object):
+    """ Returns synthetic ticker, chart, trade and lending data """
+
+    def __init__(self, markets=None):
+        self.markets = markets or fakeMarkets()
+        self._orders = count(1)
+
+    def returnTicker(self):
+        tick = {}
+        for i, market in enumerate(self.markets):
+            last = 0.01 + i * 0.001
+            tick[market] = {'id': i + 1, 'last': str(last),
+                            'lowestAsk': str(last * 1.001),
+                            'highestBid': str(last * 0.999),
+                            'percentChange': '0.0', 'baseVolume': '10.0',
+                            'quoteVolume': '1000.0', 'isFrozen': '0',
+                            'high24hr': str(last * 1.05),
+                            'low24hr': str(last * 0.95)}
+        return tick
+
+    def returnChartData(self, pair, period=MINUTE * 5, start=0, end=0):
+        start = int(start - start % period)
+        dates = np.arange(start, int(end), period)
+        close = 0.01 * np.exp(np.cumsum(
+            np.random.RandomState(start % 2 ** 31).normal(0, 0.002,
+                                                          len(dates))))
+        return [{'date': int(d), 'open': c, 'high': c * 1.002,
+                 'low': c * 0.998, 'close': c, 'volume': 1.0,
+                 'quoteVolume': 100.0, 'weightedAverage': c}
+                for d, c in zip(dates.tolist(), close.tolist())]
+
+    def returnTradeHistory(self, pair, start=0, end=0, n=1000):
+        step = max((end - start) / n, 1)
+        return [{'globalTradeID': int(start + i * step) * 10 + i % 10,
+                 'tradeID': i, 'date': epoch2UTCstr(start + i * step),
+                 'type': 'buy' if i % 2 else 'sell',
+                 'rate': '0.01', 'amount': '1.0', 'total': '0.01',
+                 'fee': '0.0025', 'orderNumber': str(i)}
+                for i in range(n)]
+
+    def returnLendingHistory(self, start=0, end=0, n=1000):
+        step = max((end - start) / n, 1)
+        return [{'id': int(start + i * step) * 10 + i % 10,
+                 'currency': 'BTC', 'rate': '0.0002', 'amount': '1.0',
+                 'duration': '0.5', 'interest': '0.0001',
+                 'fee': '-0.00001', 'earned': '0.00009',
+                 'open': epoch2UTCstr(start + i * step),
+                 'close': epoch2UTCstr(start + i * step + DAY / 2)}
+                for i in range(n)]
+
+    def buy(self, market, rate, amount):
+        return {'orderNumber': str(next(self._orders)), 'resultingTrades': []}
+
+    def sell(self, market, rate, amount):
+        return {'orderNumber': str(next(self._orders)), 'resultingTrades': []}
+
+
+def tickerStream(rest, n=100000, seed=666):
+    """ Yields <n> websocket style ticker messages for <rest>'s markets """
+    rand = random.Random(seed)
+    base = rest.returnTicker()
+    rows = [[float(base[m][f]) for f in
+             ('id', 'last', 'lowestAsk', 'highestBid', 'percentChange',
+              'baseVolume', 'quoteVolume', 'isFrozen', 'high24hr',
+              'low24hr')] for m in rest.markets]
+    for _ in range(n):
+        row = list(rand.choice(rows))
+        move = 1 + rand.uniform(-0.002, 0.002)
+        row[1] *= move
+        row[2] *= move
+        row[3] *= move
+        yield row
+
+
+class OfflinePoloniex(Poloniex):
+    """
+    Poloniex in replay mode, REST calls go to a 'FakeREST' and data to the
+    mongo database <db>
+    """
+
+    def __init__(self, rest, db):
+        super(OfflinePoloniex, self).__init__(
+            exchange=rest, mongo=db.client, chartCache=False,
+            resultCache=False)
+        self.db = db
+
+
+class RawBatchCursor(object):
+    """
+    'find_raw_batches' cursor for mongomock, yields the docs of a normal
+    cursor as concatenated BSON batches like pymongo does
+    """
+
+    def __init__(self, cursor, batch_size=100):
+        self._cursor = cursor
+        self._size = batch_size or 100
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def __iter__(self):
+        import bson
+        batch = []
+        for doc in self._cursor:
+            batch.append(bson.encode(doc))
+            if len(batch) == self._size:
+                yield b''.join(batch)
+                batch = []
+        if batch:
+            yield b''.join(batch)
+
+
+def findRawBatches(self, filter=None, projection=None, batch_size=0,
+                   **kwargs):
+    """ mongomock stand-in for 'Collection.find_raw_batches' """
+    return RawBatchCursor(self.find(filter, projection, **kwargs), batch_size)
+
+
+def getMongo(uri=None):
+    """
+    Returns a mongo client for <uri> (a local mongod) or a mongomock
+    client if no uri is given
+    """
+    if uri:
+        import pymongo
+        return pymongo.MongoClient(uri)
+    import mongomock
+    # mongomock has no raw batches, which 'tools.loadColumns' reads
+    mongomock.collection.Collection.find_raw_batches = findRawBatches
+    return mongomock.MongoClient()
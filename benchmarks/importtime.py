@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Import time guard: times imports in fresh interpreters and fails if
+importing donnie (or its light submodules) runs a heavy dependency.
+
+    python benchmarks/importtime.py [--max 0.5]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must stay unloaded until they are used
+HEAVY = ('numpy', 'pandas', 'sklearn', 'pymongo', 'bson', 'finta', 'tqdm',
+         'joblib')
+
+# imports that must not pull in HEAVY
+LIGHT = ('import donnie',
+         'import donnie.stopbook',
+         'import donnie.metrics')
+
+PROBE = '''
+import sys, json
+from time import perf_counter
+start = perf_counter()
+%s
+took = perf_counter() - start
+# lazy modules sit in sys.modules until an attribute is used
+loaded = [m for m in %r if m in sys.modules and
+          type(sys.modules[m]).__name__ != '_LazyModule']
+print(json.dumps({'seconds': took, 'loaded': loaded}))
+'''
+
+
+def probe(statement, repeat=5):
+    """ Returns the best import time of <statement> and what it loaded """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', PROBE % (statement, HEAVY)], cwd=ROOT)
+        result = json.loads(out.decode().strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def run(maxSeconds=0.5):
+    """ Returns {statement: result} and a list of failures """
+    results, failures = {}, []
+    for statement in LIGHT:
+        results[statement] = r = probe(statement)
+        if r['loaded']:
+            failures.append('%s loaded %s' % (statement, ', '.join(r['loaded'])))
+        if r['seconds'] > maxSeconds:
+            failures.append('%s took %.3fs (max %.3fs)' % (
+                statement, r['seconds'], maxSeconds))
+    return results, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--max', type=float, default=0.5,
+                        help='max seconds allowed per import')
+    args = parser.parse_args()
+    results, failures = run(args.max)
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print('FAIL: ' + failure)
+    sys.exit(1 if failures else 0)
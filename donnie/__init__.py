@@ -20,11 +20,37 @@
 #
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from importlib import import_module
+
 from . import tools
-from . import poloapi
-from . import brain
 
 logger = tools.getLogger(__name__)
 
-Poloniex = poloapi.Poloniex
-Brain = brain.Brain
+# submodules are imported on first use so 'import donnie' stays cheap
+_modules = ('poloapi', 'brain', 'stopbook', 'ticker', 'cache', 'indicators',
+            'walkforward', 'backtest', 'metrics', 'bars', 'book',
+            'recorder', 'replay')
+
+_exports = {'Poloniex': 'poloapi',
+            'Brain': 'brain',
+            'StopBook': 'stopbook',
+            'TickerStore': 'ticker',
+            'ChartCache': 'cache',
+            'ResultCache': 'cache',
+            'IncrementalIndicators': 'indicators',
+            'BarAggregator': 'bars',
+            'OrderBook': 'book',
+            'TickRecorder': 'recorder',
+            'LocalExchange': 'replay'}
+
+
+def __getattr__(name):
+    if name in _modules:
+        return import_module('.' + name, __name__)
+    if name in _exports:
+        return getattr(import_module('.' + _exports[name], __name__), name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_modules) | set(_exports))
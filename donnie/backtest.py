@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .tools import getLogger, np, pd
+
+logger = getLogger(__name__)
+
+
+def backtest(df, signal='predict', price='close', fee=0.0025, short=False,
+             capital=1.0):
+    """
+    Vectorized backtest of a <signal> column over a chart dataframe
+    (like the ones returned by 'Poloniex.chartDataFrame').
+    signal > 0 = long, < 0 = short (flat unless short=True), 0 = flat
+    A position change is filled at that candle's <price> and pays <fee>
+    (poloniex taker fee by default) on the size traded.
+    Returns a dataframe of position, fill price, traded size, fee, candle
+    return and equity
+    """
+    px = df[price].values.astype(float)
+    pos = np.sign(np.nan_to_num(df[signal].values.astype(float)))
+    if not short:
+        pos = np.clip(pos, 0, None)
+    # price change of every candle
+    change = np.zeros(len(px))
+    change[1:] = px[1:] / px[:-1] - 1
+    # the position held during a candle is the one taken on the one before
+    held = np.zeros(len(px))
+    held[1:] = pos[:-1]
+    traded = np.abs(np.diff(pos, prepend=0.0))
+    fees = traded * fee
+    ret = held * change - fees
+    return pd.DataFrame({'position': pos,
+                         'fill': np.where(traded > 0, px, np.nan),
+                         'traded': traded,
+                         'fee': fees,
+                         'return': ret,
+                         'equity': capital * np.cumprod(1 + ret)},
+                        index=df.index)
+
+
+def backtestStats(result):
+    """ Summarizes a 'backtest' result """
+    equity = result['equity'].values
+    if not len(equity):
+        return {}
+    peak = np.maximum.accumulate(equity)
+    return {'candles': len(equity),
+            'trades': int(np.count_nonzero(result['traded'].values)),
+            'fees': float(result['fee'].values.sum()),
+            'return': float(np.prod(1 + result['return'].values) - 1),
+            'maxDrawdown': float((equity / peak - 1).min()),
+            'exposure': float(np.count_nonzero(result['position'].values) /
+                              len(equity))}
+
+
+def _runBacktest(job):
+    pair, df, kwargs = job
+    result = backtest(df, **kwargs)
+    return pair, result, backtestStats(result)
+
+
+def backtestMany(frames, workers=None, **kwargs):
+    """
+    Backtests many pairs on a process pool
+    frames = {pair: chart dataframe with a signal column}
+    kwargs = passed to 'backtest'
+    Returns ({pair: result dataframe}, stats dataframe indexed by pair)
+    """
+    workers = workers or os.cpu_count()
+    jobs = [(pair, frames[pair], kwargs) for pair in frames]
+    with ProcessPoolExecutor(workers) as pool:
+        done = list(pool.map(_runBacktest, jobs))
+    results = {pair: result for pair, result, _ in done}
+    stats = pd.DataFrame({pair: stat for pair, _, stat in done}).T
+    return results, stats
+
+
+def _firstHit(test, size, grid, after=None, cells=2 ** 24):
+    """
+    Returns, for each grid row, the first position (or -1) where
+    'test(lo, hi)' (a grid x (hi - lo) bool array) is True, scanning
+    <size> positions in chunks so memory stays around <cells> bools.
+    after = per row position to start looking from (-1 = never)
+    """
+    first = np.full(grid, -1)
+    step = max(1, cells // max(grid, 1))
+    for lo in range(0, size, step):
+        hi = min(size, lo + step)
+        hits = test(lo, hi)
+        if after is not None:
+            cols = np.arange(lo, hi)
+            hits &= (after[:, None] >= 0) & (cols[None, :] >= after[:, None])
+        found = hits.any(axis=1) & (first < 0)
+        first[found] = lo + hits[found].argmax(axis=1)
+        if (first >= 0).all():
+            break
+    return first
+
+
+def simulateStops(bid, ask, amount, stops, limits, index=None):
+    """
+    Replays highestBid/lowestAsk series against a whole grid of stop/limit
+    parameters at once, using the trigger rules of 'Poloniex._check_stop':
+    a sell stop (amount < 0) triggers once stop >= highestBid, a buy stop
+    (amount > 0) once stop <= lowestAsk. The limit order placed on the
+    trigger fills once the highestBid reaches the limit (sell) or the
+    lowestAsk drops to the limit (buy).
+    bid, ask = price arrays (use candle 'low'/'high' to replay candles)
+    stops, limits = arrays broadcast against each other to form the grid,
+        e.g. stops[:, None] and limits[None, :]
+    index = labels for the trigger/fill times (e.g. df.index)
+    Returns a dataframe with a row per stop/limit pair (empty if there
+    are no prices)
+    """
+    columns = ['stop', 'limit', 'triggered', 'filled', 'triggerTime',
+               'fillTime', 'fillPrice']
+    bid = np.asarray(bid, dtype=float)
+    ask = np.asarray(ask, dtype=float)
+    stops, limits = np.broadcast_arrays(np.asarray(stops, dtype=float),
+                                        np.asarray(limits, dtype=float))
+    stops, limits = stops.ravel(), limits.ravel()
+    size, grid = len(bid), len(stops)
+    if not size:
+        return pd.DataFrame(columns=columns)
+    if amount < 0:
+        trig = _firstHit(lambda lo, hi: stops[:, None] >= bid[None, lo:hi],
+                         size, grid)
+        fill = _firstHit(lambda lo, hi: bid[None, lo:hi] >= limits[:, None],
+                         size, grid, after=trig)
+    else:
+        trig = _firstHit(lambda lo, hi: stops[:, None] <= ask[None, lo:hi],
+                         size, grid)
+        fill = _firstHit(lambda lo, hi: ask[None, lo:hi] <= limits[:, None],
+                         size, grid, after=trig)
+    labels = np.asarray(index if index is not None else np.arange(size))
+    out = pd.DataFrame({'stop': stops, 'limit': limits,
+                        'triggered': trig >= 0, 'filled': fill >= 0})
+    out['triggerTime'] = pd.Series(labels[trig], dtype=labels.dtype
+                                   ).where(trig >= 0)
+    out['fillTime'] = pd.Series(labels[fill], dtype=labels.dtype
+                                ).where(fill >= 0)
+    out['fillPrice'] = np.where(fill >= 0, limits, np.nan)
+    return out[columns]
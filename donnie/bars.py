@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from collections import deque
+from threading import Lock
+
+from .tools import getLogger, bulkUpsert, np, pd
+
+logger = getLogger(__name__)
+
+# bar fields, the same as the chart collections plus a trade count
+BAR_FIELDS = ('date', 'open', 'high', 'low', 'close', 'volume',
+              'quoteVolume', 'weightedAverage', 'trades')
+
+
+class BarAggregator(object):
+    """
+    Builds OHLCV bars of <period> seconds (1, 10, 60...) from a stream of
+    trades. Each trade only updates the open bar of its pair, once a trade
+    lands in a later period the open bar is closed and kept in a deque of
+    the last <maxlen> bars ('self.bars[pair]').
+    With a <db> (the poloniex database) closed bars are upserted in batches
+    of <batch> bars to the '<PAIR>-bars-<period>' collections, which use the
+    chart candle layout so 'getChartDataFrame' can read them.
+    Periods without trades get no bar. Trades older than the open bar are
+    dropped and counted in 'self.late'.
+    """
+
+    def __init__(self, period=60, maxlen=1000, batch=100, db=None):
+        self.period = int(period)
+        self.maxlen = maxlen
+        self.batch = batch
+        self.db = db
+        # pair: open bar as a list in BAR_FIELDS order
+        self._open = {}
+        # pair: deque of closed bars (dicts)
+        self.bars = {}
+        # closed bars waiting to be written
+        self._pending = []
+        self._lock = Lock()
+        self.late = 0
+
+    def collection(self, pair):
+        """ Returns the name of the bar collection of <pair> """
+        return '%s-bars-%d' % (pair.upper(), self.period)
+
+    def add(self, pair, date, rate, amount):
+        """
+        Adds a trade of <amount> at <rate> made at epoch <date> to <pair>.
+        Returns the bar that was closed by this trade or None
+        """
+        date = int(date)
+        rate = float(rate)
+        amount = float(amount)
+        start = date - date % self.period
+        closed = None
+        with self._lock:
+            bar = self._open.get(pair)
+            if bar is None or start > bar[0]:
+                if bar is not None:
+                    closed = self._close(pair, bar)
+                self._open[pair] = [start, rate, rate, rate, rate,
+                                    rate * amount, amount, rate, 1]
+            elif start < bar[0]:
+                self.late += 1
+                return None
+            else:
+                if rate > bar[2]:
+                    bar[2] = rate
+                elif rate < bar[3]:
+                    bar[3] = rate
+                bar[4] = rate
+                bar[5] += rate * amount
+                bar[6] += amount
+                bar[8] += 1
+            flush = self.db is not None and len(self._pending) >= self.batch
+        if flush:
+            self.flush()
+        return closed
+
+    def _close(self, pair, bar):
+        if bar[6]:
+            bar[7] = bar[5] / bar[6]
+        bar = dict(zip(BAR_FIELDS, bar))
+        if pair not in self.bars:
+            self.bars[pair] = deque(maxlen=self.maxlen)
+        self.bars[pair].append(bar)
+        if self.db is not None:
+            self._pending.append((pair, bar))
+        return bar
+
+    def addMessage(self, pair, msg):
+        """
+        Adds a websocket trade message of <pair>
+        ['t', tradeID, type, rate, amount, timestamp]
+        """
+        return self.add(pair, msg[5], msg[3], msg[4])
+
+    def addTrades(self, pair, dates, rates, amounts):
+        """
+        Adds many trades of <pair> (sequences of epochs, rates and amounts),
+        they are sorted by date first. Returns the number of closed bars
+        """
+        dates = np.asarray(dates)
+        order = np.argsort(dates, kind='mergesort')
+        closed = 0
+        for date, rate, amount in zip(dates[order].tolist(),
+                                      np.asarray(rates)[order].tolist(),
+                                      np.asarray(amounts)[order].tolist()):
+            if self.add(pair, date, rate, amount) is not None:
+                closed += 1
+        return closed
+
+    def openBar(self, pair):
+        """ Returns the open (still changing) bar of <pair> or None """
+        with self._lock:
+            bar = self._open.get(pair)
+            if bar is None:
+                return None
+            bar = list(bar)
+        if bar[6]:
+            bar[7] = bar[5] / bar[6]
+        return dict(zip(BAR_FIELDS, bar))
+
+    def flush(self, final=False):
+        """
+        Writes the closed bars waiting in memory to the db, <final> also
+        writes the open bars (they are overwritten once they close).
+        Returns the number of bars written
+        """
+        if self.db is None:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if final:
+            pending.extend((pair, self.openBar(pair))
+                           for pair in list(self._open))
+        byPair = {}
+        for pair, bar in pending:
+            byPair.setdefault(pair, []).append(dict(bar))
+        written = 0
+        for pair, bars in byPair.items():
+            try:
+                bulkUpsert(self.db[self.collection(pair)], bars, 'date',
+                           self.batch, progress=False)
+                written += len(bars)
+            except Exception as e:
+                logger.exception(e)
+                # keep them for the next flush
+                with self._lock:
+                    self._pending.extend((pair, bar) for bar in bars)
+        return written
+
+    def frame(self, pair, live=True):
+        """
+        Returns the bars of <pair> kept in memory as a dataframe indexed by
+        date, <live> includes the open bar
+        """
+        bars = list(self.bars.get(pair, ()))
+        if live:
+            bar = self.openBar(pair)
+            if bar:
+                bars.append(bar)
+        df = pd.DataFrame(bars, columns=BAR_FIELDS).set_index('date')
+        df['date'] = pd.to_datetime(df.index, unit='s')
+        return df
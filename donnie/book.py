@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from .tools import getLogger, isString, json
+
+logger = getLogger(__name__)
+
+
+class BookSide(object):
+    """
+    One side of an order book as two parallel 'array('d')' columns of
+    prices and sizes sorted from the best price outwards (asks ascending,
+    bids descending, bids are keyed by -price).
+    Setting a level costs a bisect, plus a memmove of the levels behind it
+    when a level is added or removed. The running size/cost sums used by
+    depth queries are only valid up to the first changed level and are
+    extended lazily up to the level a query needs. So a query costs a
+    bisect plus re-summing the levels between the last change and the
+    queried price: O(log n) while the book is unchanged, O(n) worst case
+    right after a change at the touch with a query deep in the book.
+    """
+
+    def __init__(self, sign):
+        # 1 for asks, -1 for bids
+        self.sign = sign
+        # sign * price, ascending
+        self.keys = array('d')
+        self.sizes = array('d')
+        # running size/cost sums, valid for the first len() levels
+        self._cumSizes = array('d')
+        self._cumCosts = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _invalidate(self, i):
+        """ Drops the running sums from level <i> on """
+        del self._cumSizes[i:]
+        del self._cumCosts[i:]
+
+    def set(self, price, size):
+        """ Sets the <size> at <price>, a size of 0 removes the level """
+        key = self.sign * price
+        i = bisect_left(self.keys, key)
+        found = i < len(self.keys) and self.keys[i] == key
+        if size > 0:
+            if found:
+                self.sizes[i] = size
+            else:
+                self.keys.insert(i, key)
+                self.sizes.insert(i, size)
+        elif found:
+            del self.keys[i]
+            del self.sizes[i]
+        else:
+            return
+        self._invalidate(i)
+
+    def load(self, levels):
+        """ Replaces the side with a {price: size} dict """
+        levels = sorted((self.sign * float(p), float(s))
+                        for p, s in levels.items() if float(s) > 0)
+        self.keys = array('d', [l[0] for l in levels])
+        self.sizes = array('d', [l[1] for l in levels])
+        self._invalidate(0)
+
+    def best(self):
+        """ Returns the best (price, size) or None """
+        if not self.keys:
+            return None
+        return self.sign * self.keys[0], self.sizes[0]
+
+    def _extend(self, stop=None, size=None):
+        """
+        Extends the running sums up to level <stop> or until they reach
+        <size>. Returns the (sizes, costs) sums
+        """
+        sizes, costs = self._cumSizes, self._cumCosts
+        k = len(sizes)
+        stop = len(self.keys) if stop is None else stop
+        total = sizes[-1] if k else 0.0
+        cost = costs[-1] if k else 0.0
+        while k < stop and (size is None or total < size):
+            total += self.sizes[k]
+            cost += self.sign * self.keys[k] * self.sizes[k]
+            sizes.append(total)
+            costs.append(cost)
+            k += 1
+        return sizes, costs
+
+    def depth(self, price):
+        """ Returns the total size at prices as good as <price> or better """
+        i = bisect_right(self.keys, self.sign * price)
+        return self._extend(stop=i)[0][i - 1] if i else 0.0
+
+    def cost(self, size):
+        """
+        Returns the total cost of taking <size> from the best price out,
+        or None if the side is not deep enough
+        """
+        sizes, costs = self._extend(size=size)
+        i = bisect_left(sizes, size)
+        if i == len(sizes):
+            return None
+        if not i:
+            return size * self.sign * self.keys[0]
+        return costs[i - 1] + (size - sizes[i - 1]) * self.sign * self.keys[i]
+
+    def levels(self, n=None):
+        """ Returns the first <n> (price, size) levels """
+        keys, sizes = self.keys[:n], self.sizes[:n]
+        return [(self.sign * k, s) for k, s in zip(keys, sizes)]
+
+
+class OrderBook(object):
+    """
+    Order book of one market kept from the websocket book channel.
+    'i' snapshots replace the book and 'o' diffs set a single level
+    (['o', 1 for bids/0 for asks, price, size], size 0 removes it), 't'
+    trade messages are passed back to the caller. 'self.gaps' counts
+    skipped sequence numbers (the book should be resubscribed).
+    """
+
+    def __init__(self, market=None):
+        self.market = market
+        self.asks = BookSide(1)
+        self.bids = BookSide(-1)
+        # last sequence number applied
+        self.seq = None
+        self.gaps = 0
+        self._lock = Lock()
+
+    def _side(self, side):
+        if side == 'asks':
+            return self.asks
+        if side == 'bids':
+            return self.bids
+        raise ValueError('side must be "asks" or "bids" not %r' % side)
+
+    def update(self, msg):
+        """
+        Applies a websocket book message, either the full
+        [channel, seq, [update, ...]] message, a list of updates or a
+        single update. Returns the 't' trade updates it contained
+        """
+        if not msg:
+            return []
+        if isString(msg[0]):
+            updates = [msg]
+        elif len(msg) > 2 and isinstance(msg[2], list) and not \
+                isinstance(msg[0], list):
+            updates = msg[2]
+            if msg[1] is not None:
+                seq = int(msg[1])
+                if self.seq is not None:
+                    if seq <= self.seq:
+                        # already applied
+                        return []
+                    if seq > self.seq + 1:
+                        self.gaps += 1
+                self.seq = seq
+        else:
+            updates = msg
+        trades = []
+        with self._lock:
+            for u in updates:
+                if u[0] == 'o':
+                    side = self.bids if int(u[1]) else self.asks
+                    side.set(float(u[2]), float(u[3]))
+                elif u[0] == 'i':
+                    self.market = u[1].get('currencyPair', self.market)
+                    asks, bids = u[1]['orderBook'][:2]
+                    self.asks.load(asks)
+                    self.bids.load(bids)
+                elif u[0] == 't':
+                    trades.append(u)
+        return trades
+
+    def best(self):
+        """ Returns the (lowestAsk, highestBid) prices """
+        with self._lock:
+            ask, bid = self.asks.best(), self.bids.best()
+        return ask and ask[0], bid and bid[0]
+
+    def depth(self, side, price):
+        """
+        Returns the total size on <side> ('asks' or 'bids') at prices as
+        good as <price> or better
+        """
+        side = self._side(side)
+        with self._lock:
+            return side.depth(price)
+
+    def vwap(self, side, size):
+        """
+        Returns the average price of taking <size> from <side> ('asks' to
+        buy, 'bids' to sell), or None if the book is not deep enough
+        """
+        side = self._side(side)
+        with self._lock:
+            cost = side.cost(size)
+        return cost / size if cost is not None and size else None
+
+    def fillable(self, amount, limit):
+        """
+        Returns True if <amount> (negative to sell, like stop orders) can be
+        filled at <limit> or better with the liquidity in the book
+        """
+        side = self.asks if amount > 0 else self.bids
+        with self._lock:
+            return side.depth(limit) >= abs(amount)
+
+    def levels(self, n=10):
+        """ Returns the first <n> {'asks': [(price, size)...], 'bids': ...} """
+        with self._lock:
+            return {'asks': self.asks.levels(n), 'bids': self.bids.levels(n)}
+
+
+def replayBook(messages, market=None, bars=None):
+    """
+    Builds an 'OrderBook' from recorded websocket book <messages> (lists or
+    json strings, one message each). Trades are added to the optional
+    'bars.BarAggregator' <bars>. Returns the book
+    """
+    book = OrderBook(market)
+    for msg in messages:
+        if isString(msg):
+            msg = json.loads(msg)
+        trades = book.update(msg)
+        if bars is not None:
+            for trade in trades:
+                bars.addMessage(book.market, trade)
+    return book
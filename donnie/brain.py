@@ -23,27 +23,50 @@
 #
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import GaussianNB
 from sklearn import preprocessing
 from sklearn.metrics import accuracy_score
 import joblib
+from collections import deque
+from time import perf_counter
 
 from .tools import (getLogger, pd, np, time, shuffleDataFrame,
                      json, isString, prepDataframe, splitTrainTestData)
+from . import metrics
 
 logger = getLogger(__name__)
 
 
+def incrementalLobes():
+    """
+    Lobes that can learn from new rows only: 'partial_fit' estimators and
+    a warm-started forest that grows new trees
+    """
+    return {'sgd': SGDClassifier(random_state=666),
+            'nb': GaussianNB(),
+            'rf': RandomForestClassifier(n_estimators=7,
+                                         warm_start=True,
+                                         random_state=666)
+            }
+
+
 class Brain(object):
     """
     The Brain object
     Holds sklrean classifiers and makes it simpler to train using a dataframe
     """
 
-    def __init__(self, lobes=False):
+    def __init__(self, lobes=False, window=None):
         """
         lobes = a dict of classifiers to use in the VotingClassifier
             defaults to RandomForestClassifier and DecisionTreeClassifier
+            (see 'incrementalLobes' for lobes that work well with 'learn')
+        window = max number of recent rows kept to refit lobes that cant
+            learn incrementally (None keeps no rows)
         """
+        # feature scaler fitted by 'train(preprocess=True)'
+        self._scaler = None
         if isString(lobes):
             try:
                 self.load(lobes.split('.pickle')[0])
@@ -60,6 +83,13 @@ class Brain(object):
             voting='hard',
             n_jobs=-1)
         self._trained = False
+        self.window = window
+        self._window = None
+        # seconds per sample of the last full fit
+        self._fitRate = None
+        self.stats = {'samples': 0, 'learnTime': 0.0, 'saved': 0.0}
+        # latency of the last fast path predictions
+        self._latency = deque(maxlen=10000)
 
     def train(self, df, shuffle=True, preprocess=False, *args, **kwargs):
         """
@@ -69,6 +99,16 @@ class Brain(object):
             logger.warning('Overwriting an already trained brain!')
             self._trained = False
 
+        self._scaler = None
+        if preprocess:
+            # keep the scaler so 'learn'/'predict' see the same scale
+            self._scaler = preprocessing.StandardScaler().fit(
+                df.drop('label', axis=1).values)
+        if self.window:
+            # most recent rows, before shuffling
+            recent = df.tail(self.window)
+            self._window = (self._scale(recent.drop('label', axis=1).values),
+                            recent['label'].values)
         # shuffle data for good luck
         if shuffle:
             df = shuffleDataFrame(df)
@@ -76,15 +116,161 @@ class Brain(object):
         x = df.drop('label', axis=1).values
         y = df['label'].values
         del df
-        if preprocess:
-            x = preprocessing.scale(x)
+        x = self._scale(x)
         logger.info('Training with %d samples', len(x))
+        start = time()
         self.lobe.fit(x, y)
+        self._fitRate = (time() - start) / max(len(x), 1)
+        self.stats['samples'] = len(x)
         self._trained = True
 
+    def _scale(self, x):
+        """ Applies the 'train(preprocess=True)' scaling to rows <x> """
+        if self._scaler is None:
+            return x
+        return self._scaler.transform(x)
+
+    def learn(self, df, addTrees=2):
+        """
+        Updates a trained brain with only the new labelled rows in <df>.
+        Lobes with 'partial_fit' learn the rows, warm-started forests grow
+        <addTrees> trees on them, other lobes are refit on the sliding
+        window (a ValueError is raised if there is no window, refitting
+        them on the new rows alone would forget everything else).
+        Trains from scratch if untrained.
+        Returns the estimated seconds saved compared to a full refit
+        """
+        if not self._trained:
+            self.train(df)
+            return 0.0
+        if not self.window:
+            refit = [name for name, est in zip(
+                        [e[0] for e in self.lobe.estimators],
+                        self.lobe.estimators_)
+                     if not hasattr(est, 'partial_fit') and
+                     not getattr(est, 'warm_start', False)]
+            if refit:
+                raise ValueError(
+                    'Lobes %s cant learn incrementally, use a Brain '
+                    'window or retrain' % ', '.join(refit))
+        x = self._scale(df.drop('label', axis=1).values)
+        y = df['label'].values
+        start = time()
+        if self.window:
+            if self._window is None:
+                self._window = (x[-self.window:], y[-self.window:])
+            else:
+                self._window = (
+                    np.concatenate([self._window[0], x])[-self.window:],
+                    np.concatenate([self._window[1], y])[-self.window:])
+        try:
+            yenc = self.lobe.le_.transform(y)
+        except ValueError:
+            # new label classes, the voter has to be refit
+            if self._window is None:
+                logger.warning('New labels found, refitting the brain on '
+                               'the new rows only (no window)')
+            else:
+                logger.warning('New labels found, refitting the brain on '
+                               'the window')
+            wx, wy = self._window if self._window is not None else (x, y)
+            self._trained = False
+            self.lobe.fit(wx, wy)
+            self._trained = True
+            return 0.0
+        classes = len(self.lobe.le_.classes_)
+        for est in self.lobe.estimators_:
+            if hasattr(est, 'partial_fit'):
+                est.partial_fit(x, yenc)
+            elif getattr(est, 'warm_start', False):
+                # new trees need every class, use the window if the new
+                # rows dont have them all
+                tx, ty = x, yenc
+                if len(set(ty)) < classes and self._window is not None:
+                    tx = self._window[0]
+                    ty = self.lobe.le_.transform(self._window[1])
+                if len(set(ty)) < classes:
+                    logger.warning('Not every label in the new rows, '
+                                   'skipping %s', type(est).__name__)
+                    continue
+                # fitting without more trees would do nothing
+                est.n_estimators += addTrees
+                est.fit(tx, ty)
+            else:
+                est.fit(self._window[0],
+                        self.lobe.le_.transform(self._window[1]))
+        took = time() - start
+        self.stats['samples'] += len(x)
+        self.stats['learnTime'] += took
+        saved = 0.0
+        if self._fitRate is not None:
+            samples = self.stats['samples']
+            if self.window:
+                samples = min(samples, self.window)
+            saved = self._fitRate * samples - took
+            self.stats['saved'] += saved
+        logger.info('Learned %d new samples in %.3f sec (%.3f sec saved)',
+                    len(x), took, saved)
+        return saved
+
     def predict(self, df):
         """ Get a prediction from the votingLobe """
-        return self.lobe.predict(prepDataframe(df).values)
+        m = metrics.METRICS
+        if m:
+            with m.timer('predict_seconds', path='predict'):
+                return self.lobe.predict(
+                    self._scale(prepDataframe(df).values))
+        return self.lobe.predict(self._scale(prepDataframe(df).values))
+
+    def predictRows(self, x):
+        """
+        Fast prediction path for numpy feature rows (one row or a 2d batch).
+        Skips the dataframe copies and hard-votes in-process without the
+        joblib dispatch. Rows must already be clean (no nan/inf).
+        Returns an array of labels
+        """
+        start = perf_counter()
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        x = self._scale(x)
+        classes = self.lobe.le_.classes_
+        weights = self.lobe.weights or [1] * len(self.lobe.estimators_)
+        votes = np.zeros((len(x), len(classes)))
+        rows = np.arange(len(x))
+        for est, w in zip(self.lobe.estimators_, weights):
+            votes[rows, est.predict(x).astype(int)] += w
+        # ties go to the lowest class, same as VotingClassifier
+        labels = classes[votes.argmax(axis=1)]
+        took = perf_counter() - start
+        self._latency.append(took)
+        m = metrics.METRICS
+        if m:
+            m.observe('predict_seconds', took, path='predictRows')
+        return labels
+
+    def predictMarkets(self, rows):
+        """
+        Predicts the latest feature vector of many markets in one call
+        rows = {market: feature vector}
+        Returns {market: label}
+        """
+        markets = list(rows)
+        labels = self.predictRows(np.vstack([rows[m] for m in markets]))
+        return dict(zip(markets, labels))
+
+    def latencyStats(self):
+        """
+        Returns p50/p99/max latency (in seconds) of the last 10000 fast
+        path predictions
+        """
+        if not self._latency:
+            return {}
+        lat = np.array(self._latency)
+        return {'count': len(lat),
+                'p50': float(np.percentile(lat, 50)),
+                'p99': float(np.percentile(lat, 99)),
+                'max': float(lat.max())}
 
     def score(self, df, test='predict'):
         """ Get a prediction score from the votingLobe """
@@ -95,6 +281,8 @@ class Brain(object):
         """ Pickle the brain """
         if self._trained:
             joblib.dump(self.lobe, location + ".pickle")
+            if self._scaler is not None:
+                joblib.dump(self._scaler, location + ".scaler.pickle")
             logger.info('Brain %s saved', location + '.pickle')
         else:
             return logger.error('Brain is not trained yet! Nothing to save...')
@@ -103,4 +291,8 @@ class Brain(object):
         """ Loads a brain pickle """
         logger.info('Loading saved brain %s', location + '.pickle')
         self.lobe = joblib.load(location + ".pickle")
+        try:
+            self._scaler = joblib.load(location + ".scaler.pickle")
+        except FileNotFoundError:
+            self._scaler = None
         self._trained = True
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+from collections import OrderedDict
+from hashlib import sha1
+
+from .tools import (getLogger, getHomeDir, np, pd, pymongo, Lock, json,
+                    loadColumns, CHART_COLUMNS)
+
+logger = getLogger(__name__)
+
+
+class ChartCache(object):
+    """
+    On-disk columnar cache for chart collections. Every column is an
+    append-only binary file in '<location>/<collection>/', reads
+    memory-map the '_id' column, bisect the requested time range and slice
+    the other columns without creating per-candle python objects.
+    """
+
+    def __init__(self, location=None):
+        """
+        location = cache folder, defaults to '~/.donnie/cache'
+        """
+        if not location:
+            location = os.path.join(getHomeDir(), '.donnie', 'cache')
+        self.location = location
+        self._lock = Lock()
+
+    def _path(self, name, col):
+        return os.path.join(self.location, name, col + '.bin')
+
+    def _column(self, name, col):
+        """ Memory-maps a column, returns an empty array if it is missing """
+        dtype = np.dtype('i8' if col == '_id' else 'f8')
+        path = self._path(name, col)
+        if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r',
+                         shape=(os.path.getsize(path) // dtype.itemsize,))
+
+    def ids(self, name):
+        """ Returns the (memory-mapped) '_id' column of <name> """
+        return self._column(name, '_id')
+
+    def last(self, name):
+        """ Returns the last cached '_id' of <name> or None """
+        ids = self.ids(name)
+        return int(ids[-1]) if len(ids) else None
+
+    def truncate(self, name, since):
+        """ Drops every cached row of <name> with an '_id' >= <since> """
+        with self._lock:
+            self._truncate(name, int(np.searchsorted(self.ids(name), since)))
+
+    def _truncate(self, name, pos):
+        for col in ('_id',) + CHART_COLUMNS:
+            path = self._path(name, col)
+            if os.path.exists(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(pos * 8)
+
+    def append(self, name, columns):
+        """
+        Appends a dict of column arrays (sorted by '_id') to <name>.
+        Cached rows at or after the first new '_id' are replaced, so the
+        still open last candle can be rewritten. Returns rows written
+        """
+        ids = np.asarray(columns['_id'], dtype='i8')
+        if not len(ids):
+            return 0
+        with self._lock:
+            os.makedirs(os.path.join(self.location, name), exist_ok=True)
+            self._truncate(name, int(np.searchsorted(self.ids(name), ids[0])))
+            for col in ('_id',) + CHART_COLUMNS:
+                if col == '_id':
+                    values = ids
+                elif col in columns:
+                    values = np.asarray(columns[col], dtype='f8')
+                else:
+                    values = np.full(len(ids), np.nan)
+                with open(self._path(name, col), 'ab') as f:
+                    f.write(values.tobytes())
+        return len(ids)
+
+    def sync(self, db):
+        """
+        Appends the candles of collection <db> that are newer than the
+        cache (including the last cached candle). Returns rows written
+        """
+        last = self.last(db.name)
+        query = {'_id': {'$gte': last}} if last is not None else {}
+        columns = loadColumns(db, query, CHART_COLUMNS,
+                              sort=[('_id', pymongo.ASCENDING)])
+        logger.debug('Caching %d %s candles', len(columns['_id']), db.name)
+        return self.append(db.name, columns)
+
+    def read(self, name, start=None, end=None, columns=CHART_COLUMNS):
+        """
+        Returns a dict of memory-mapped column slices of <name> for
+        start < '_id' <= end
+        """
+        ids = self.ids(name)
+        lo = 0 if start is None else int(np.searchsorted(ids, start, 'right'))
+        hi = len(ids) if end is None else int(
+            np.searchsorted(ids, end, 'right'))
+        out = {'_id': ids[lo:hi]}
+        for col in columns:
+            if col in CHART_COLUMNS:
+                out[col] = self._column(name, col)[lo:hi]
+        return out
+
+    def frame(self, name, start=None, end=None, columns=CHART_COLUMNS):
+        """
+        Returns the cached candles of <name> for start < '_id' <= end as a
+        dataframe indexed by '_id' with a datetime 'date' column
+        """
+        data = self.read(name, start, end, columns)
+        ids = data.pop('_id')
+        # columns can differ in length after an interrupted append
+        size = min([len(ids)] + [len(data[c]) for c in data])
+        # copy out of the maps, the files get truncated/appended later
+        df = pd.DataFrame({c: np.array(data[c][:size]) for c in data},
+                          index=pd.Index(np.array(ids[:size]), name='_id'))
+        df['date'] = pd.to_datetime(df.index, unit='s')
+        return df
+
+
+class ResultCache(object):
+    """
+    Memory bounded LRU cache for resampled/indicator chart dataframes,
+    keyed on (pair, zoom, indica config, last candle id, frame). An
+    optional on-disk tier (one pickle per key in <location>) lets other
+    processes reuse results. 'stats' counts hits, disk hits, misses and
+    evictions.
+    """
+
+    def __init__(self, maxBytes=256 * 1024 ** 2, location=None):
+        """
+        maxBytes = memory budget for cached dataframes
+        location = folder for the disk tier (disabled if None)
+        """
+        self.maxBytes = maxBytes
+        self.location = location
+        if location:
+            os.makedirs(location, exist_ok=True)
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._size = 0
+        self._lock = Lock()
+        self.stats = {'hits': 0, 'diskHits': 0, 'misses': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        # an empty cache is still enabled
+        return True
+
+    @staticmethod
+    def makeKey(pair, zoom, indica, last, frame=None, incremental=False):
+        """
+        Builds a cache key with a canonicalized indicator config. <last> is
+        the last candle (its close/volume change while the candle is open)
+        or just its '_id'
+        """
+        if isinstance(last, dict):
+            last = (int(last['_id']), last.get('close'), last.get('volume'))
+        else:
+            last = int(last)
+        return (pair.upper(), str(zoom or ''),
+                json.dumps(indica or {}, sort_keys=True, default=str),
+                last, frame, bool(incremental))
+
+    def _path(self, key):
+        name = sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.location, name + '.pickle')
+
+    def get(self, key):
+        """ Returns a copy of the cached df for <key> or None """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._items[key].copy()
+        if self.location and os.path.exists(self._path(key)):
+            try:
+                df = pd.read_pickle(self._path(key))
+            except Exception as e:
+                logger.exception(e)
+            else:
+                self.stats['diskHits'] += 1
+                self._remember(key, df)
+                return df.copy()
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, df):
+        """ Caches <df> under <key> (in memory and on disk if enabled) """
+        df = df.copy()
+        self._remember(key, df)
+        if self.location:
+            tmp = self._path(key) + '.%d.tmp' % os.getpid()
+            df.to_pickle(tmp)
+            os.replace(tmp, self._path(key))
+
+    def _remember(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.maxBytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= self._sizes.pop(key)
+                del self._items[key]
+            while self._items and self._size + size > self.maxBytes:
+                old, _ = self._items.popitem(last=False)
+                self._size -= self._sizes.pop(old)
+                self.stats['evictions'] += 1
+            self._items[key] = df
+            self._sizes[key] = size
+            self._size += size
+
+    def clear(self):
+        """ Empties the memory tier (the disk tier is left alone) """
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self._size = 0
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from collections import deque
+from copy import deepcopy
+from math import sqrt, isnan
+
+from .tools import getLogger, np, pd, finta, addIndicators
+
+logger = getLogger(__name__)
+
+NAN = float('nan')
+
+
+def _ewmAlpha(span=None, alpha=None):
+    """ Smoothing factor the way pandas derives it from span/alpha """
+    com = (span - 1) / 2.0 if span is not None else 1.0 / alpha - 1
+    return 1.0 / (1.0 + com)
+
+
+class _EWM(object):
+    """ Running 'Series.ewm(...).mean()' (ignore_na=False) """
+
+    def __init__(self, alpha, adjust=True):
+        self.alpha = alpha
+        self.adjust = adjust
+        self.weighted = NAN
+        self.oldWt = 1.0
+
+    def step(self, cur):
+        newWt = 1.0 if self.adjust else self.alpha
+        if self.weighted == self.weighted:
+            self.oldWt *= 1 - self.alpha
+            if cur == cur:
+                if self.weighted != cur:
+                    self.weighted = self.oldWt * self.weighted + newWt * cur
+                    self.weighted /= (self.oldWt + newWt)
+                if self.adjust:
+                    self.oldWt += newWt
+                else:
+                    self.oldWt = 1.0
+        elif cur == cur:
+            self.weighted = cur
+        return self.weighted
+
+
+class _Window(object):
+    """ Last <period> values of a column """
+
+    def __init__(self, period):
+        self.period = period
+        self.values = deque(maxlen=period)
+
+    def push(self, cur):
+        self.values.append(cur)
+        full = len(self.values) == self.period
+        return full and not any(isnan(v) for v in self.values)
+
+
+class EMA(object):
+    def __init__(self, period=9, column='close', adjust=True):
+        self.column = column
+        self.names = ['{0} period EMA'.format(period)]
+        self.ewm = _EWM(_ewmAlpha(span=period), adjust)
+
+    def step(self, row):
+        return (self.ewm.step(row[self.column]),)
+
+
+class SMA(object):
+    def __init__(self, period=41, column='close'):
+        self.column = column
+        self.names = ['{0} period SMA'.format(period)]
+        self.window = _Window(period)
+
+    def step(self, row):
+        if not self.window.push(row[self.column]):
+            return (NAN,)
+        return (sum(self.window.values) / self.window.period,)
+
+
+class BBANDS(object):
+    def __init__(self, period=20, column='close', std_multiplier=2):
+        self.column = column
+        self.mult = std_multiplier
+        self.names = ['BB_UPPER', 'BB_MIDDLE', 'BB_LOWER']
+        self.window = _Window(period)
+
+    def step(self, row):
+        if not self.window.push(row[self.column]):
+            return (NAN, NAN, NAN)
+        n = self.window.period
+        mean = sum(self.window.values) / n
+        std = sqrt(sum((v - mean) ** 2 for v in self.window.values) / (n - 1))
+        return (mean + self.mult * std, mean, mean - self.mult * std)
+
+
+class RSI(object):
+    def __init__(self, period=14, column='close', adjust=True):
+        self.column = column
+        self.names = ['{0} period RSI'.format(period)]
+        self.gain = _EWM(_ewmAlpha(alpha=1.0 / period), adjust)
+        self.loss = _EWM(_ewmAlpha(alpha=1.0 / period), adjust)
+        self.prev = NAN
+
+    def step(self, row):
+        cur = row[self.column]
+        delta = cur - self.prev
+        self.prev = cur
+        gain = self.gain.step(max(delta, 0.0) if delta == delta else NAN)
+        loss = self.loss.step(-min(delta, 0.0) if delta == delta else NAN)
+        if loss == 0:
+            # pandas division: x/0 = inf, 0/0 = nan
+            rs = float('inf') if gain > 0 else NAN
+        else:
+            rs = gain / loss
+        return (100 - (100 / (1 + rs)),)
+
+
+class MACD(object):
+    def __init__(self, period_fast=12, period_slow=26, signal=9,
+                 column='close', adjust=True):
+        self.column = column
+        self.names = ['MACD', 'SIGNAL']
+        self.fast = _EWM(_ewmAlpha(span=period_fast), adjust)
+        self.slow = _EWM(_ewmAlpha(span=period_slow), adjust)
+        self.signal = _EWM(_ewmAlpha(span=signal), adjust)
+
+    def step(self, row):
+        cur = row[self.column]
+        macd = self.fast.step(cur) - self.slow.step(cur)
+        return (macd, self.signal.step(macd))
+
+
+# indicators with rolling state, anything else falls back to 'finta.TA'
+INCREMENTAL = {'EMA': EMA, 'SMA': SMA, 'BBANDS': BBANDS, 'RSI': RSI,
+               'MACD': MACD}
+
+
+class IncrementalIndicators(object):
+    """
+    Keeps rolling state for the indicators in <conf> (same format as
+    'tools.addIndicators') so each update only computes the rows added
+    since the last one. The last row is treated as an open candle and
+    recomputed on the next update. Indicators without an incremental
+    version (or with unsupported arguments) are fully recomputed.
+    Values always match 'addIndicators' on the same frame, so a frame
+    whose first row moves (a sliding window) resets the state.
+
+    Example ('chart' is an ohlc df like 'getChartDataFrame' returns):
+        inc = IncrementalIndicators(RSI={'period': 14}, EMA={'period': 9})
+        df = inc.update(chart.iloc[:-10])
+        df = inc.update(chart)  # only computes the last 11 rows
+    """
+
+    def __init__(self, **conf):
+        self.conf = conf
+        self.reset()
+
+    def reset(self):
+        """ Drops all state, the next update recomputes everything """
+        # state up to (not including) the provisional last row
+        self._committed = {}
+        for ind in self.conf:
+            if ind in INCREMENTAL:
+                try:
+                    self._committed[ind] = INCREMENTAL[ind](**self.conf[ind])
+                    continue
+                except TypeError:
+                    pass
+            logger.debug('%s has no incremental version', ind)
+        # row labels (last one is provisional) and their values
+        self._labels = []
+        self._values = {ind: [] for ind in self._committed}
+
+    def update(self, df):
+        """
+        Adds the configured indicators to ohlc <df>, only computing rows
+        newer than the last update. Returns the df like 'addIndicators'
+        """
+        idx = df.index
+        if not len(idx):
+            return addIndicators(df, **self.conf)
+        labels = self._labels
+        if labels and idx[0] != labels[0]:
+            # ewm weights and warm-up rows depend on the first row
+            logger.debug('Frame start moved, resetting the indicator state')
+            self.reset()
+            labels = self._labels
+        # roll back the provisional last row
+        if labels:
+            labels.pop()
+            for ind in self._values:
+                self._values[ind].pop()
+        new = df[idx > labels[-1]] if labels else df
+        columns = {c: new[c].values.tolist() for c in
+                   set(s.column for s in self._committed.values())}
+        n = len(new)
+        for i in range(n):
+            if i == n - 1:
+                # keep the committed state clean of the open candle
+                states = deepcopy(self._committed)
+            else:
+                states = self._committed
+            row = {c: columns[c][i] for c in columns}
+            for ind in states:
+                self._values[ind].append(states[ind].step(row))
+        labels.extend(new.index.tolist())
+
+        frames = []
+        avail = dir(finta.TA)
+        for ind in self.conf:
+            if ind in self._committed:
+                state = self._committed[ind]
+                frames.append(pd.DataFrame(self._values[ind],
+                                           index=labels,
+                                           columns=state.names
+                                           ).reindex(idx))
+            elif ind in avail:
+                frames.append(
+                    getattr(finta.TA, ind)(ohlc=df, **self.conf[ind]))
+        # same column order as 'addIndicators'
+        return pd.concat(frames[::-1] + [df], axis=1)
+
+    def verify(self, df, rtol=1e-9):
+        """
+        Checks the incremental values for <df> against a full 'finta.TA'
+        recompute, logs and returns False on a mismatch
+        """
+        fresh = IncrementalIndicators(**self.conf)
+        fresh.update(df.iloc[:max(len(df) // 2, 1)])
+        inc = fresh.update(df)
+        full = addIndicators(df, **self.conf)
+        ok = True
+        for col in full:
+            if not np.issubdtype(full[col].dtype, np.number):
+                continue
+            if not np.allclose(inc[col].values, full[col].values,
+                               rtol=rtol, equal_nan=True):
+                logger.error('Incremental %s does not match finta', col)
+                ok = False
+        return ok
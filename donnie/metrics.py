@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Low overhead counters, gauges and latency histograms for the hot paths.
+Instrumented code checks the module level METRICS, so while it is None
+(the default) the only cost is one attribute lookup.
+
+    >>> m = metrics.enable()
+    >>> m.snapshot()
+    >>> metrics.PrometheusServer(m, port=9099)
+    >>> metrics.LogSink(m, every=60)
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import perf_counter
+
+from .tools import getLogger, Lock, Thread, sleep
+
+logger = getLogger(__name__)
+
+# active registry, None disables all instrumentation
+METRICS = None
+
+# histogram bucket upper bounds in seconds (1us - 10s)
+BUCKETS = tuple(m * 10 ** e for e in range(-6, 1) for m in (1, 2.5, 5)
+                ) + (10.0,)
+
+
+def enable(registry=None):
+    """ Turns instrumentation on, returns the active 'Metrics' """
+    global METRICS
+    METRICS = registry or Metrics()
+    return METRICS
+
+
+def disable():
+    """ Turns instrumentation off """
+    global METRICS
+    METRICS = None
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class Histogram(object):
+    """ Fixed bucket histogram """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """ Upper bucket bound holding the <q> quantile """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics(object):
+    """ Registry of counters, gauges and histograms """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = Lock()
+
+    def inc(self, name, n=1, **labels):
+        """ Adds <n> to a counter """
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, name, value, **labels):
+        """ Sets a gauge to <value> (or a callable read on snapshot) """
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """ Adds a value (seconds) to a histogram """
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ Times the with block into histogram <name> """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """ Returns a dict of every metric """
+        def fmt(key):
+            name, labels = key
+            if not labels:
+                return name
+            return '%s{%s}' % (name, ','.join('%s=%s' % l for l in labels))
+        with self._lock:
+            out = {'counters': {fmt(k): v for k, v in self.counters.items()},
+                   'gauges': {},
+                   'histograms': {}}
+            for k, h in self.histograms.items():
+                out['histograms'][fmt(k)] = {
+                    'count': h.count, 'sum': h.sum,
+                    'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}
+        for k, v in list(self.gauges.items()):
+            out['gauges'][fmt(k)] = v() if callable(v) else v
+        return out
+
+    def prometheus(self):
+        """ Returns every metric in the prometheus text format """
+        def fmt(name, labels, extra=()):
+            labels = labels + tuple(extra)
+            if not labels:
+                return name
+            return '%s{%s}' % (name, ','.join('%s="%s"' % l for l in labels))
+        lines = []
+        with self._lock:
+            for (name, labels), v in sorted(self.counters.items()):
+                lines.append('%s %s' % (fmt(name + '_total', labels), v))
+            for (name, labels), h in sorted(self.histograms.items()):
+                seen = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    seen += n
+                    lines.append('%s %d' % (
+                        fmt(name + '_bucket', labels, [('le', repr(bound))]),
+                        seen))
+                lines.append('%s %d' % (
+                    fmt(name + '_bucket', labels, [('le', '+Inf')]), h.count))
+                lines.append('%s %r' % (fmt(name + '_sum', labels), h.sum))
+                lines.append('%s %d' % (fmt(name + '_count', labels),
+                                        h.count))
+        for (name, labels), v in sorted(self.gauges.items()):
+            lines.append('%s %s' % (fmt(name, labels), v() if callable(v)
+                                    else v))
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusServer(object):
+    """ Serves 'Metrics.prometheus()' on http://<host>:<port>/metrics """
+
+    def __init__(self, metrics, port=9099, host='127.0.0.1'):
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self._t = Thread(target=self.server.serve_forever, daemon=True)
+        self._t.start()
+        logger.info('Serving metrics on http://%s:%d/metrics', host, port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LogSink(object):
+    """ Logs a 'Metrics.snapshot()' every <every> seconds """
+
+    def __init__(self, metrics, every=60):
+        self.metrics = metrics
+        self.every = every
+        self._running = True
+        self._t = Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def _run(self):
+        while self._running:
+            sleep(self.every)
+            logger.info('metrics: %s', self.metrics.snapshot())
+
+    def stop(self):
+        self._running = False
@@ -21,63 +21,152 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import count
+from collections import deque
+from time import perf_counter
+
 import poloniex
 from .tools import (getDatabase, getLogger, zoomOHLC, addIndicators,
                     getChartDataFrame, updateChartData, updateTradeHistData,
                     updateLendingHistData, getLastEntry, UTCstr2epoch,
-                    epoch2UTCstr, time)
+                    epoch2UTCstr, time, np, pd, pymongo, RateLimiter,
+                    planWindows, loadColumns, CHART_COLUMNS, json,
+                    ROLLUPS, getRollupName, rollupChartData, DAY,
+                    HISTORY_START, getCoverage, addCoverage, findGaps,
+                    loadModules, bson, getFirstEntry, findRuns,
+                    setCoverage, isString)
+from .stopbook import StopBook
+from .ticker import TickerStore
+from .cache import ChartCache, ResultCache
+from .indicators import IncrementalIndicators
+from .bars import BarAggregator
+from .book import OrderBook
+from .recorder import TickRecorder
+from .replay import replay
+from . import metrics
 
 logger = getLogger(__name__)
 
+# REST calls routed to the local exchange in replay mode
+REST_CALLS = ('returnTicker', 'returnChartData', 'returnTradeHistory',
+              'returnLendingHistory', 'buy', 'sell', 'cancelOrder',
+              'moveOrder', 'returnBalances', 'returnOpenOrders')
+
 
 class Poloniex(poloniex.PoloniexSocketed):
     def __init__(self, *args, **kwargs):
         kwargs['subscribe'] = kwargs.get('subscribe', {'ticker': self.on_ticker})
         kwargs['start'] = kwargs.get('start', True)
         kwargs['jsonNums'] = kwargs.get('jsonNums', float)
-        super(Poloniex, self).__init__(*args, **kwargs)
-        self.db = getDatabase('poloniex')
+        # number of REST windows fetched at once while backfilling
+        self.backfillWorkers = kwargs.pop('backfillWorkers', 4)
+        # number of threads placing triggered stop orders
+        self.orderWorkers = kwargs.pop('orderWorkers', 2)
+        # local columnar candle cache (False to always read from mongo)
+        self.chartCache = kwargs.pop('chartCache', True)
+        if self.chartCache is True:
+            self.chartCache = ChartCache()
+        # LRU cache of zoomed/indicator frames (False to disable)
+        self.resultCache = kwargs.pop('resultCache', True)
+        if self.resultCache is True:
+            self.resultCache = ResultCache()
+        # incremental indicator engines by (pair, zoom, indica)
+        self._indicators = {}
+        # 'BarAggregator' fed with the trades of subscribed order books
+        self.bars = kwargs.pop('bars', None)
+        # live order books by market (see 'subscribeBook')
+        self.books = {}
+        # 'TickRecorder' logging every ticker message (True for defaults)
+        self.recorder = kwargs.pop('recorder', None)
+        if self.recorder is True:
+            self.recorder = TickRecorder()
+        if self.recorder:
+            self.recorder.start()
+        # mongo client to use instead of the shared one ('tools.MONGO')
+        mongo = kwargs.pop('mongo', None)
+        # replay mode: no websocket, REST calls go to this local exchange
+        # (see 'replay.LocalExchange')
+        self.exchange = kwargs.pop('exchange', None)
+        if self.exchange is None:
+            super(Poloniex, self).__init__(*args, **kwargs)
+        else:
+            self.logger = logger
+            for call in REST_CALLS:
+                if hasattr(self.exchange, call):
+                    setattr(self, call, getattr(self.exchange, call))
+        self.db = getDatabase('poloniex', mongo)
+        # get inital ticker data
+        self._setup(self.returnTicker())
+
+
+    def _setup(self, iniTick):
+        """ Sets up the stop order and ticker state from REST ticker data """
+        # shared REST budget for backfills (poloniex allows 6 calls/sec)
+        self._limiter = RateLimiter(6, 1.0)
         # holds stop orders
         self.stopOrders = {}
+        # untriggered stop orders indexed by market and stop price
+        self.stopBook = StopBook()
+        self._stopIds = count()
+        # triggered stops are placed here so the socket thread never waits
+        self._orderPool = ThreadPoolExecutor(self.orderWorkers)
+        # trigger-to-submit latency of the last triggered stops
+        self.stopLatency = deque(maxlen=1000)
         # holds ticker data
-        self.tick = {}
+        self.tick = TickerStore()
         # holds market ids
         self._ids = {}
-        # get inital ticker data
-        iniTick = self.returnTicker()
+        # holds market names by id
+        self._markets = {}
         for market in iniTick:
             self._ids[market] = int(iniTick[market]['id'])
-            self.tick[self._ids[market]] = {
-                item: float(iniTick[market][item]) for item in iniTick[market]
-                }
+            self._markets[self._ids[market]] = market
+            self.tick.add(market, iniTick[market])
 
 
     def on_ticker(self, msg):
-        # save ticker updates to self.tick
-        data = [float(dat) for dat in msg]
-        self.tick[int(data[0])] = {'id': int(data[0]),
-                                  'last': data[1],
-                                  'lowestAsk': data[2],
-                                  'highestBid': data[3],
-                                  'percentChange': data[4],
-                                  'baseVolume': data[5],
-                                  'quoteVolume': data[6],
-                                  'isFrozen': int(data[7]),
-                                  'high24hr': data[8],
-                                  'low24hr': data[9]
-                                  }
+        m = metrics.METRICS
+        if m:
+            start = perf_counter()
+        # save ticker updates to the market row in self.tick
+        if self.tick.update(msg) is None:
+            self._addMarket(int(msg[0]), msg)
         # check stop orders
-        self.checkMarketStops(int(data[0]), data[2], data[3])
+        self.checkMarketStops(int(msg[0]), float(msg[2]), float(msg[3]))
+        # queue for the recorder thread
+        recorded = self.recorder is None or self.recorder.record(msg)
+        if m:
+            m.observe('tick_seconds', perf_counter() - start)
+            m.inc('ticks')
+            if self.recorder is not None:
+                m.gauge('recorder_queue', len(self.recorder))
+                if not recorded:
+                    m.inc('ticks_dropped')
+
+
+    def _addMarket(self, id, msg):
+        """ Adds a market listed after startup from its first ticker msg """
+        try:
+            market = self._getChannelName(id)
+        except Exception:
+            market = None
+        if not isString(market) or market == str(id):
+            market = str(id)
+        self._ids[market] = id
+        self._markets[id] = market
+        self.tick.add(market, msg)
+        self.logger.info('New market %s (id %d) added to the ticker',
+                         market, id)
 
 
     def checkMarketStops(self, mkt, la, hb):
         if isinstance(mkt, int):
-            mkt = self._getChannelName(mkt)
-        for id in self.stopOrders:
-            # market matches and the order hasnt triggered yet
-            if str(self.stopOrders[id]['market']) == str(mkt) and not self.stopOrders[id]['order']:
-                self.logger.info('%s lowAsk=%s highBid=%s', mkt, str(la), str(hb))
-                self._check_stop(id, la, hb)
+            mkt = self._markets.get(mkt) or self._getChannelName(mkt)
+        # only the stops crossed by this tick come out of the book
+        for id in self.stopBook.triggered(mkt, la, hb):
+            self.logger.info('%s lowAsk=%s highBid=%s', mkt, str(la), str(hb))
+            self._check_stop(id, la, hb)
 
 
     def _check_stop(self, id, lowAsk, highBid):
@@ -85,49 +174,176 @@ class Poloniex(poloniex.PoloniexSocketed):
         stop = self.stopOrders[id]['stop']
         # sell
         if amount < 0 and stop >= float(highBid):
-            # dont place order if we are testing
-            self.stopOrders[id]['order'] = True
-            if not self.stopOrders[id]['test']:
-                # sell amount at limit
-                self.stopOrders[id]['order'] = self.sell(
-                    self.stopOrders[id]['market'],
-                    self.stopOrders[id]['limit'],
-                    abs(amount))
-
-            self.logger.info('%s sell stop order triggered! (%s)',
-                             self.stopOrders[id]['market'],
-                             str(stop))
-            if self.stopOrders[id]['callback']:
-                self.stopOrders[id]['callback'](id)
+            self._trigger_stop(id, 'sell')
 
         # buy
         if amount > 0 and stop <= float(lowAsk):
+            self._trigger_stop(id, 'buy')
+
+
+    def _trigger_stop(self, id, side):
+        """ Marks a stop as pending and hands it to the order workers """
+        self.stopOrders[id]['order'] = 'pending'
+        self.stopOrders[id]['triggered'] = time()
+        self.logger.info('%s %s stop order triggered! (%s)',
+                         self.stopOrders[id]['market'], side,
+                         str(self.stopOrders[id]['stop']))
+        self._orderPool.submit(self._execute_stop, id, side)
+        m = metrics.METRICS
+        if m:
+            m.inc('stops_triggered', side=side)
+            m.gauge('order_queue', self._orderPool._work_queue.qsize())
+            m.gauge('stops_active', len(self.stopBook))
+
+
+    def _execute_stop(self, id, side):
+        """ Places a triggered stop order (runs on self._orderPool) """
+        order = self.stopOrders[id]
+        order['submitted'] = time()
+        order['latency'] = order['submitted'] - order['triggered']
+        self.stopLatency.append(order['latency'])
+        m = metrics.METRICS
+        if m:
+            m.observe('stop_submit_seconds', order['latency'])
+            m.gauge('order_queue', self._orderPool._work_queue.qsize())
+        self.logger.debug('%s %s stop submitted %.6f sec after trigger',
+                          order['market'], side, order['latency'])
+        try:
             # dont place order if we are testing
-            self.stopOrders[id]['order'] = True
-            if not self.stopOrders[id]['test']:
-                self.stopOrders[id]['order'] = self.buy(
-                    self.stopOrders[id]['market'],
-                    self.stopOrders[id]['limit'],
-                    amount)
-
-            self.logger.info('%s buy stop order triggered! (%s)',
-                             self.stopOrders[id]['market'],
-                             str(stop))
-            if self.stopOrders[id]['callback']:
-                self.stopOrders[id]['callback'](id)
+            if order['test']:
+                order['order'] = True
+            elif side == 'sell':
+                # sell amount at limit
+                start = perf_counter()
+                order['order'] = self.sell(order['market'], order['limit'],
+                                           abs(order['amount']))
+                self._observeRest('sell', start)
+            else:
+                start = perf_counter()
+                order['order'] = self.buy(order['market'], order['limit'],
+                                          order['amount'])
+                self._observeRest('buy', start)
+        except Exception as e:
+            self.logger.exception(e)
+            order['order'] = False
+            order['error'] = str(e)
+        if order['callback']:
+            try:
+                order['callback'](id)
+            except Exception as e:
+                self.logger.exception(e)
+
+
+    def _observeRest(self, call, start):
+        m = metrics.METRICS
+        if m:
+            m.observe('rest_seconds', perf_counter() - start, call=call)
+
+
+    def stopLatencyStats(self):
+        """
+        Returns the trigger-to-submit latency percentiles (p50, p99, max)
+        of the last 1000 triggered stops in seconds
+        """
+        if not self.stopLatency:
+            return {}
+        lat = np.array(self.stopLatency)
+        return {'count': len(lat),
+                'p50': float(np.percentile(lat, 50)),
+                'p99': float(np.percentile(lat, 99)),
+                'max': float(lat.max())}
 
 
     def addStopLimit(self, market, amount, stop, limit, callback=None, test=False):
-        self.stopOrders[market+str(stop)] = {'market': market,
-                                             'amount': amount,
-                                             'stop': stop,
-                                             'limit': limit,
-                                             'callback': callback,
-                                             'test': test,
-                                             'order': False
-                                            }
+        """
+        Adds a stop limit order, negative <amount> for sells.
+        Returns the stop id
+        """
+        id = '%s%s-%d' % (market, str(stop), next(self._stopIds))
+        self.stopOrders[id] = {'market': market,
+                               'amount': amount,
+                               'stop': stop,
+                               'limit': limit,
+                               'callback': callback,
+                               'test': test,
+                               'order': False
+                              }
+        self._indexStop(id)
         self.logger.info('%s stop limit set: [Amount]%.8f [Stop]%.8f [Limit]%.8f',
                           market, amount, stop, limit)
+        return id
+
+
+    def _indexStop(self, id):
+        order = self.stopOrders[id]
+        if order['amount'] < 0:
+            self.stopBook.add(id, order['market'], 'sell', order['stop'])
+        elif order['amount'] > 0:
+            self.stopBook.add(id, order['market'], 'buy', order['stop'])
+
+
+    def cancelStop(self, id):
+        """ Cancels an untriggered stop order, returns the removed order """
+        if not self.stopBook.remove(id):
+            self.logger.error('%s is not an active stop order!', id)
+            return False
+        self.logger.info('%s stop limit canceled', id)
+        return self.stopOrders.pop(id)
+
+
+    def modifyStop(self, id, amount=None, stop=None, limit=None):
+        """ Changes the amount, stop and/or limit of an untriggered stop """
+        if not self.stopBook.remove(id):
+            self.logger.error('%s is not an active stop order!', id)
+            return False
+        order = self.stopOrders[id]
+        if amount is not None:
+            order['amount'] = amount
+        if stop is not None:
+            order['stop'] = stop
+        if limit is not None:
+            order['limit'] = limit
+        self._indexStop(id)
+        self.logger.info('%s stop limit modified: [Amount]%.8f [Stop]%.8f [Limit]%.8f',
+                          id, order['amount'], order['stop'], order['limit'])
+        return order
+
+
+    def subscribeBook(self, market):
+        """
+        Subscribes to the order book channel of <market>, the book is kept
+        in 'self.books[market]' (see 'book.OrderBook'). Returns the book
+        """
+        if market not in self.books:
+            self.books[market] = OrderBook(market)
+        self.subscribe(market, lambda msg: self.on_book(market, msg))
+        return self.books[market]
+
+
+    def on_book(self, market, msg):
+        # apply snapshot/diff updates, pass trades on to the bar aggregator
+        trades = self.books[market].update(msg)
+        if self.bars is not None:
+            for trade in trades:
+                self.bars.addMessage(market, trade)
+        m = metrics.METRICS
+        if m:
+            m.inc('book_messages')
+            if trades:
+                m.inc('trades', len(trades))
+
+
+    def stopLiquidity(self, id):
+        """
+        Checks stop <id> against the live order book of its market.
+        Returns True if the book can fill its amount at its limit, False if
+        not and None if the market book isnt subscribed
+        """
+        order = self.stopOrders[id]
+        book = self.books.get(order['market'])
+        if book is None:
+            return None
+        return book.fillable(order['amount'], order['limit'])
 
 
     def ticker(self, market=None):
@@ -136,7 +352,7 @@ class Poloniex(poloniex.PoloniexSocketed):
         and REST ticker data if the socket isnt running. Auto-subscribes to
         ticker if the socket is running and not subscribed.
         """
-        if not self.channels['ticker']['sub']:
+        if self.exchange is None and not self.channels['ticker']['sub']:
             if not self._t or not self._running:
                 self.logger.error("Websocket isn't running!")
                 return self.returnTicker()
@@ -146,7 +362,27 @@ class Poloniex(poloniex.PoloniexSocketed):
                 return self.returnTicker()
         if market:
             return self.tick[self._ids[market]]
-        return self.tick
+        return self.tick.toDict()
+
+
+    def tickerFrame(self, frame=True):
+        """
+        Returns the saved ticker data of every market at once, as a
+        dataframe indexed by market or (frame=False) as a zero-copy numpy
+        structured array with rows in the order of 'self.tick.markets'
+        """
+        if frame:
+            return self.tick.frame()
+        return self.tick.array
+
+
+    def replay(self, ticks, speed=None):
+        """
+        Feeds recorded or synthetic <ticks> through 'on_ticker' as fast as
+        possible or <speed> times faster than recorded, returns the ticks
+        per second stats (see 'replay.replay')
+        """
+        return replay(self, ticks, speed)
 
 
     def cbck(self, id):
@@ -156,183 +392,309 @@ class Poloniex(poloniex.PoloniexSocketed):
         print(self.stopOrders[id])
 
 
-    def chartDataFrame(self, pair, frame=172800, zoom=False, indica=False):
+    def _backfill(self, fetch, update, db, scol, label='', overlap=0):
+        """
+        Plans the 3 month windows needed to fill every gap in the coverage
+        index of <db> (from HISTORY_START to now), fetches them
+        concurrently with 'fetch(start=, end=)' (bounded by
+        self.backfillWorkers and the REST rate limit) and writes each window
+        with 'update(db, data)' as soon as it arrives. Written windows are
+        added to the coverage index, minus the last <overlap> seconds which
+        can still change (open candles). Covered ranges are never fetched
+        again. Returns the number of entrys written
+        """
+        now = time()
+        ranges = getCoverage(self.db, db.name)
+        if ranges is None:
+            # seed the index with data synced before the index existed
+            ranges = self._seedCoverage(db, scol)
+        windows = []
+        for start, end in reversed(findGaps(ranges, HISTORY_START, now)):
+            windows.extend(planWindows(start, end, self.MONTH * 3))
+        if not windows:
+            return 0
+        # metric label, 'chart', 'tradeHistory' or 'lendingHistory'
+        kind = db.name.split('-')[-1]
+
+        def get(window):
+            self._limiter.wait()
+            self.logger.debug('Getting %s - %s %s from Poloniex...',
+                              epoch2UTCstr(window[0]),
+                              epoch2UTCstr(window[1]), label)
+            start = perf_counter()
+            new = fetch(start=window[0], end=window[1])
+            self._observeRest(kind, start)
+            return new
+
+        total = 0
+        pending = {}
+        windows = iter(windows)
+        # the workers must not be the first to use a lazy module
+        loadModules(np, pymongo, bson)
+        with ThreadPoolExecutor(self.backfillWorkers) as pool:
+            # keep a few windows in flight while we write the finished ones
+            for window in windows:
+                pending[pool.submit(get, window)] = window
+                if len(pending) >= self.backfillWorkers * 2:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = pending.pop(future)
+                    try:
+                        new = future.result()
+                        self.logger.debug(
+                            'Updating %s database with %d entrys...',
+                            label, len(new))
+                        if new:
+                            begin = perf_counter()
+                            update(db, new, progress=False)
+                            m = metrics.METRICS
+                            if m:
+                                m.observe('mongo_write_seconds',
+                                          perf_counter() - begin,
+                                          collection=kind)
+                                m.inc('mongo_rows', len(new),
+                                      collection=kind)
+                    except Exception as e:
+                        # left out of the index, the next sync retries it
+                        self.logger.exception(e)
+                    else:
+                        total += len(new)
+                        end = min(end, now - overlap)
+                        if end > start:
+                            addCoverage(self.db, db.name, start, end)
+                    window = next(windows, None)
+                    if window:
+                        pending[pool.submit(get, window)] = window
+        return total
+
+
+    def _seedCoverage(self, db, scol):
+        """
+        Builds the coverage index of <db> from the data already in it.
+        Chart collections are covered where the 5min candles are
+        continuous, so holes left by earlier runs get refilled, other
+        collections from their first to their last entry
+        """
+        if db.name.endswith('-chart'):
+            ids = loadColumns(db, fields=(),
+                              sort=[('_id', pymongo.ASCENDING)])['_id']
+            ranges = findRuns(ids, 60 * 5)
+        else:
+            first = getFirstEntry(db, scol)
+            last = getLastEntry(db, scol)
+            ranges = [[first[scol], last[scol]]] if first else []
+        if not ranges:
+            self.logger.warning('%s collection is empty!', db.name)
+            return []
+        self.logger.info('%s coverage seeded with %d ranges', db.name,
+                         len(ranges))
+        return setCoverage(self.db, db.name, ranges)
+
+
+    def syncChartData(self, pair):
+        """
+        Fills the gaps in the 'pair'-chart collection with 5min candles
+        from poloniex and updates the rollups.
+        Returns the number of candles written
+        """
+        # get db collection
+        db = self.db[pair.upper() + '-chart']
+
+        # oldest candle written, rollups/cache are rebuilt from there
+        oldest = []
+
+        def update(db, new, **kwargs):
+            oldest.append(min(c['date'] for c in new))
+            return updateChartData(db, new, **kwargs)
+
+        entrys = self._backfill(
+            lambda start, end: [c for c in self.returnChartData(
+                pair, period=60 * 5, start=start, end=end) if c['date']],
+            update, db, '_id', pair + ' candles', overlap=60 * 5)
+        since = min(oldest) if oldest else None
+        self.syncRollups(pair, since)
+        if self.chartCache and since is not None:
+            # drop cached candles that may have been filled in or changed
+            self.chartCache.truncate(db.name, since)
+            for name in ROLLUPS.values():
+                self.chartCache.truncate(db.name + '-' + name, since - DAY)
+        return entrys
+
+
+    def syncRollups(self, pair, since=None):
+        """
+        Updates the 15m/1h/4h/1d rollup collections ('pair'-chart-15m...)
+        from the 5min candles, only the last open rollup candle (or the
+        rollup candles from <since>) onwards
+        """
+        base = self.db[pair.upper() + '-chart']
+        for period, name in ROLLUPS.items():
+            rollupChartData(base, self.db[base.name + '-' + name], period,
+                            since)
+
+
+    def chartDataFrame(self, pair, frame=172800, zoom=False, indica=False,
+                       fields=CHART_COLUMNS, dtype='f8', incremental=False):
         """ returns chart data in a dataframe from mongodb, updates/fills the
         data, the date column is the '_id' of each candle entry, and
         the date column has been removed. Use 'frame' to restrict the amount
-        of data returned.
+        of data returned, 'fields'/'dtype' to only load some columns
+        (with 'indica' the ohlcv columns are loaded too).
+        'incremental=True' keeps indicator state between calls so only new
+        candles are computed while the first candle of the frame stays the
+        same (see 'IncrementalIndicators').
         Example: 'frame=self.YEAR' will return last years data
         """
-        dbcolName = pair.upper() + '-chart'
-
-        # get db collection
-        db = self.db[dbcolName]
-
-        # get last candle data
-        last = getLastEntry(db)
-
-        # no entrys found, get all 5min data from poloniex
-        if not last:
-            self.logger.warning('%s collection is empty!', dbcolName)
-            last = {
-                '_id': UTCstr2epoch("2015-01-01", fmat="%Y-%m-%d")
-                }
-
-        stop = int(last['_id'])
-        start = time()
-        end = time()
-        flag = True
-        while not int(stop) == int(start) and flag:
-            # get 3 months of data at a time
-            start -= self.MONTH * 3
-
-            # dont go past 'stop'
-            if start < stop:
-                start = stop
-
-            # get needed data
-            self.logger.debug('Getting %s - %s %s candles from Poloniex...',
-                              epoch2UTCstr(start), epoch2UTCstr(end), pair)
-            new = self.returnChartData(pair,
-                                       period=60 * 5,
-                                       start=start,
-                                       end=end)
-
-            # stop if data has stopped comming in
-            if len(new) == 1:
-                flag = False
-
-            # add new candles
-            self.logger.debug(
-                'Updating %s database with %s entrys...', pair, str(len(new))
-                )
-
-            updateChartData(db, new)
-
-            # make new end the old start
-            end = start
+        self.syncChartData(pair)
+        db = self.db[pair.upper() + '-chart']
+        # read materialized rollups instead of resampling
+        rollup = getRollupName(zoom) if zoom else None
+
+        # unchanged series with the same zoom/indicators are cached
+        key = None
+        if self.resultCache and (zoom or indica):
+            last = getLastEntry(db)
+            if last:
+                key = ResultCache.makeKey(pair, zoom, indica, last,
+                                          (frame, tuple(fields), str(dtype)),
+                                          incremental)
+                df = self.resultCache.get(key)
+                if df is not None:
+                    return df
+
+        if indica and incremental:
+            ikey = (pair.upper(), str(zoom),
+                    json.dumps(indica, sort_keys=True))
+            if ikey not in self._indicators:
+                self._indicators[ikey] = IncrementalIndicators(**indica)
+            indica = self._indicators[ikey]
+
+        if rollup:
+            db = self.db[db.name + '-' + rollup]
+            zoom = None
 
         # make dataframe
         self.logger.debug('Getting %s chart data from db', pair)
-        df = getChartDataFrame(db, time() - frame, zoom, indica)
+        df = getChartDataFrame(db, time() - frame, zoom, indica,
+                               cache=self.chartCache, fields=fields,
+                               dtype=dtype)
+        if key and df is not False:
+            self.resultCache.put(key, df)
 
         return df
 
 
-    def myTradeHistory(self, pair, query=None):
+    def syncTradeHistory(self, pair):
         """
-        Retrives and saves trade history in 'pair'-tradeHistory
+        Fills the gaps in the 'pair'-tradeHistory collection from poloniex.
+        Returns the number of trades written
         """
-        dbcolName = pair.upper() + '-tradeHistory'
+        return self._backfill(
+            lambda start, end: self.returnTradeHistory(
+                pair, start=start, end=end),
+            updateTradeHistData, self.db[pair.upper() + '-tradeHistory'],
+            'date', pair + ' trades')
 
-        # get db collection
-        db = self.db[dbcolName]
-
-        # get last trade data
-        last = getLastEntry(db, 'date')
-
-        # no entrys found, get all data from poloniex
-        if not last:
-            self.logger.warning('%s collection is empty!', dbcolName)
-            last = {
-                'date': UTCstr2epoch("2015-01-01", fmat="%Y-%m-%d")
-                }
-
-        stop = int(last['date'])
-        start = time()
-        end = time()
-        flag = True
-        while not int(stop) == int(start) and flag:
-            # get 3 months of data at a time
-            start -= self.MONTH * 3
-
-            # dont go past 'stop'
-            if start < stop:
-                start = stop
-
-            # get needed data
-            self.logger.debug('Getting %s - %s %s trade data from Poloniex...',
-                              epoch2UTCstr(start), epoch2UTCstr(end), pair)
-            new = self.returnTradeHistory(pair,
-                                          start=start,
-                                          end=end)
-
-            # stop if data has stopped comming in
-            if len(new) == 1:
-                flag = False
-
-            # add new data
-            self.logger.debug(
-                'Updating %s database with %s entrys...', pair, str(len(new))
-                )
-
-            updateTradeHistData(db, new)
-
-            # make new end the old start
-            end = start
+
+    def myTradeHistory(self, pair, query=None, fields=None, dtype='f8'):
+        """
+        Retrives and saves trade history in 'pair'-tradeHistory
+        fields = only load these fields (as <dtype>) into the dataframe
+        """
+        self.syncTradeHistory(pair)
 
         # make dataframe
         self.logger.debug('Getting %s trade data from db', pair)
 
+        db = self.db[pair.upper() + '-tradeHistory']
+        if fields:
+            return pd.DataFrame(loadColumns(db, query, fields, dtype))
         df = pd.DataFrame(list(db.find(query)))
         return df
 
 
-    def myLendingHistory(self, query=False):
+    def tradeBars(self, pair, period=60, frame=172800, save=False):
+        """
+        Returns <period> second OHLCV bars (1, 10, 60...) of <pair> built
+        from the trades saved by 'myTradeHistory' over the last <frame>
+        seconds, in a dataframe indexed by date. <save> also writes them to
+        the 'pair'-bars-'period' collection (see 'BarAggregator')
+        """
+        trades = self.myTradeHistory(pair, {'date': {'$gt': time() - frame}},
+                                     fields=('date', 'rate', 'amount'))
+        bars = BarAggregator(period, maxlen=None,
+                             db=self.db if save else None)
+        bars.addTrades(pair, trades['date'], trades['rate'], trades['amount'])
+        if save:
+            bars.flush(final=True)
+        return bars.frame(pair)
+
+
+    def syncMarkets(self, pairs, kinds=('chart', 'trades'), workers=4):
+        """
+        Incrementally syncs <kinds> ('chart' and/or 'trades') for many
+        <pairs> at once on a shared thread pool. The most stale collections
+        are scheduled first and all REST calls share the same rate limit.
+        Returns a dataframe of lag (seconds behind before the sync), entrys
+        written, seconds taken and entrys/sec for each pair and kind
+        """
+        syncs = {'chart': (self.syncChartData, '-chart'),
+                 'trades': (self.syncTradeHistory, '-tradeHistory')}
+        now = time()
+        jobs = []
+        for pair in pairs:
+            for kind in kinds:
+                if kind not in syncs:
+                    self.logger.error('Unknown sync kind: %s', kind)
+                    continue
+                ranges = getCoverage(self.db, pair.upper() + syncs[kind][1])
+                lag = now - ranges[-1][1] if ranges else float('inf')
+                jobs.append((lag, pair, kind))
+        # most stale first
+        jobs.sort(key=lambda job: job[0], reverse=True)
+
+        def run(job):
+            lag, pair, kind = job
+            begin = time()
+            entrys = syncs[kind][0](pair)
+            took = time() - begin
+            return {'pair': pair, 'kind': kind, 'lag': lag, 'entrys': entrys,
+                    'seconds': took, 'rate': entrys / took if took else 0.0}
+
+        loadModules(np, pd, pymongo, bson)
+        with ThreadPoolExecutor(workers) as pool:
+            report = list(pool.map(run, jobs))
+        for r in report:
+            self.logger.info('%s %s synced: lag=%.0fs entrys=%d (%.1f/sec)',
+                             r['pair'], r['kind'], r['lag'], r['entrys'],
+                             r['rate'])
+        return pd.DataFrame(report, columns=['pair', 'kind', 'lag', 'entrys',
+                                             'seconds', 'rate']
+                            ).set_index(['pair', 'kind'])
+
+
+    def myLendingHistory(self, query=False, fields=None, dtype='f8'):
         """
         Retrives and saves lendingHistory in 'poloniex.lendingHistory' database
         query = pymongo query for .find() (defaults to last 24 hours)
+        fields = only load these fields (as <dtype>) into the dataframe
         """
         if query == False:
             query = {'open': {'$gt': time() - self.DAY}}
 
 
-        dbcolName = 'lendingHistory'
         # get db collection
-        db = self.db[dbcolName]
-        # get last trade data
-        last = getLastEntry(db, 'open')
-
-        # no entrys found, get all data from poloniex
-        if not last:
-            self.logger.warning('%s collection is empty!', dbcolName)
-            last = {
-                'open': UTCstr2epoch("2015-01-01", fmat="%Y-%m-%d")
-                }
-
-        stop = int(last['open'])
-        start = time()
-        end = time()
-        flag = True
-        while not int(stop) == int(start) and flag:
-            # get 3 months of data at a time
-            start -= self.MONTH * 3
-
-            # dont go past 'stop'
-            if start < stop:
-                start = stop
-
-            # get needed data
-            self.logger.debug('Getting %s - %s lending data from Poloniex...',
-                              epoch2UTCstr(start), epoch2UTCstr(end))
-
-            new = self.returnLendingHistory(start=start, end=end)
-
-            # stop if data has stopped comming in
-            if len(new) == 1:
-                flag = False
-
-            # add new data
-            self.logger.debug(
-                'Updating lending database with %s entrys...', str(len(new))
-                )
-
-            updateLendingHistData(db, new)
+        db = self.db['lendingHistory']
 
-            # make new end the old start
-            end = start
+        self._backfill(self.returnLendingHistory, updateLendingHistData,
+                       db, 'open', 'lending')
 
         # make dataframe
         self.logger.debug('Getting lending data from db')
+        if fields:
+            return pd.DataFrame(loadColumns(
+                db, query, fields, dtype, sort=[('open', pymongo.ASCENDING)]))
         return pd.DataFrame(list(db.find(query).sort('open',
                                                      pymongo.ASCENDING)))
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+from collections import deque
+from threading import Event
+
+from .tools import (getLogger, getHomeDir, np, Thread, time, sleep,
+                    strftime, gmtime)
+from .ticker import TICKER_FIELDS, TICKER_DTYPE
+
+logger = getLogger(__name__)
+
+# fixed-width tick record, receive time + the websocket ticker message
+TICK_DTYPE = np.dtype([('ts', 'f8')] + TICKER_DTYPE.descr)
+
+# record fields stored as integers
+_INTS = ('id', 'isFrozen')
+
+
+class TickRecorder(object):
+    """
+    Append-only binary log of ticker messages. 'record(msg)' only appends
+    (receive time, msg) to a bounded deque, a background thread drains it
+    every <interval> seconds and appends the ticks in batches of <batch>
+    'TICK_DTYPE' records to one 'ticks-YYYYMMDD.bin' segment per UTC day in
+    <location> (defaults to '~/.donnie/ticks'). 'readTicks' memory-maps the
+    segments back.
+    Once <maxsize> ticks are waiting new ticks are dropped and counted in
+    'self.dropped', or with <block> the socket thread waits for the writer
+    (counted in 'self.blocked').
+    """
+
+    def __init__(self, location=None, maxsize=100000, batch=5000,
+                 interval=0.5, block=False):
+        if not location:
+            location = os.path.join(getHomeDir(), '.donnie', 'ticks')
+        self.location = location
+        self.maxsize = maxsize
+        self.batch = batch
+        self.interval = interval
+        self.block = block
+        self._queue = deque()
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self._stop = Event()
+        self._t = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def start(self):
+        """ Starts the writer thread """
+        if self._t and self._t.is_alive():
+            return
+        os.makedirs(self.location, exist_ok=True)
+        self._stop.clear()
+        self._t = Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def stop(self):
+        """ Stops the writer thread once every queued tick is written """
+        self._stop.set()
+        if self._t:
+            self._t.join()
+        self._t = None
+        self.flush()
+
+    def record(self, msg):
+        """ Queues a websocket ticker message (called from 'on_ticker') """
+        if len(self._queue) >= self.maxsize:
+            if not self.block:
+                self.dropped += 1
+                return False
+            self.blocked += 1
+            while len(self._queue) >= self.maxsize and self._t:
+                sleep(0.001)
+        # deque appends are atomic, no lock needed on the socket thread
+        self._queue.append((time(), msg))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(e)
+
+    def flush(self):
+        """ Writes the queued ticks, returns the number written """
+        total = 0
+        while self._queue:
+            rows = []
+            while self._queue and len(rows) < self.batch:
+                ts, msg = self._queue.popleft()
+                rows.append((ts,) + tuple(
+                    int(float(v)) if f in _INTS else float(v)
+                    for f, v in zip(TICKER_FIELDS, msg)))
+            self._write(np.array(rows, dtype=TICK_DTYPE))
+            total += len(rows)
+        self.written += total
+        return total
+
+    def _write(self, records):
+        days = (records['ts'] // 86400).astype('i8')
+        # split the batch on day boundaries
+        for day in np.unique(days):
+            path = tickPath(self.location, int(day) * 86400)
+            with open(path, 'ab') as f:
+                f.write(records[days == day].tobytes())
+
+    def stats(self):
+        """ Returns the queued/written/dropped/blocked tick counts """
+        return {'queued': len(self._queue), 'written': self.written,
+                'dropped': self.dropped, 'blocked': self.blocked}
+
+
+def tickPath(location, epoch):
+    """ Returns the segment file of the UTC day of <epoch> """
+    return os.path.join(location,
+                        'ticks-%s.bin' % strftime('%Y%m%d', gmtime(epoch)))
+
+
+def readTicks(start, end=None, location=None):
+    """
+    Memory-maps the tick segments from the UTC day of <start> to the day
+    of <end> (defaults to <start>'s day). Returns a 'TICK_DTYPE' array,
+    a zero-copy memmap if only one day is read
+    """
+    if not location:
+        location = os.path.join(getHomeDir(), '.donnie', 'ticks')
+    day = int(start) // 86400 * 86400
+    end = day if end is None else int(end)
+    segments = []
+    while day <= end:
+        path = tickPath(location, day)
+        if os.path.exists(path):
+            # ignore a partly written last record
+            size = os.path.getsize(path) // TICK_DTYPE.itemsize
+            if size:
+                segments.append(np.memmap(path, dtype=TICK_DTYPE, mode='r',
+                                          shape=(size,)))
+        day += 86400
+    if not segments:
+        return np.empty(0, dtype=TICK_DTYPE)
+    if len(segments) == 1:
+        return segments[0]
+    return np.concatenate(segments)
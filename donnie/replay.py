@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from itertools import count
+from threading import Barrier, Lock
+from time import perf_counter
+
+from .tools import getLogger, np, time, sleep
+from .ticker import TICKER_FIELDS
+
+logger = getLogger(__name__)
+
+
+class LocalExchange(object):
+    """
+    Local stand-in for the poloniex REST api used by 'Poloniex' in replay
+    mode ('Poloniex(exchange=LocalExchange(...))'). Serves <ticker> (a
+    'returnTicker' style dict) and records buy/sell orders in
+    'self.orders' instead of placing them, optionally after sleeping
+    <latency> seconds like a REST round trip would.
+    """
+
+    def __init__(self, ticker, latency=0):
+        self.ticker = ticker
+        self.latency = latency
+        self.orders = []
+        self._orders = count(1)
+        self._lock = Lock()
+
+    @classmethod
+    def fromTicks(cls, ticks, names=None, **kwargs):
+        """
+        Builds the exchange ticker from the first message of each market in
+        <ticks> (ticker messages or 'readTicks' records), <names> maps
+        market ids to names (defaults to 'MKT_<id>')
+        """
+        names = names or {}
+        ticker = {}
+        seen = set()
+        for msg in ticks:
+            row = _tickRow(msg)
+            id = int(row[0])
+            if id in seen:
+                continue
+            seen.add(id)
+            ticker[names.get(id, 'MKT_%d' % id)] = dict(zip(TICKER_FIELDS,
+                                                            row))
+        return cls(ticker, **kwargs)
+
+    def returnTicker(self):
+        return {market: dict(data) for market, data in self.ticker.items()}
+
+    def _order(self, side, market, rate, amount):
+        if self.latency:
+            sleep(self.latency)
+        with self._lock:
+            number = str(next(self._orders))
+            self.orders.append({'orderNumber': number, 'side': side,
+                                'market': market, 'rate': rate,
+                                'amount': amount, 'time': time()})
+        return {'orderNumber': number, 'resultingTrades': []}
+
+    def buy(self, market, rate, amount, *args, **kwargs):
+        return self._order('buy', market, rate, amount)
+
+    def sell(self, market, rate, amount, *args, **kwargs):
+        return self._order('sell', market, rate, amount)
+
+
+def _tickRow(msg):
+    """ Returns the ticker message fields of a message or tick record """
+    if isinstance(msg, np.void):
+        return [msg[f] for f in TICKER_FIELDS]
+    return msg
+
+
+def replay(polo, ticks, speed=None):
+    """
+    Feeds <ticks> (ticker messages, or 'readTicks' records which are
+    paced by their receive time) through 'polo.on_ticker' as fast as
+    possible or <speed> times faster than they were recorded, then waits
+    for the triggered stops to be placed and their callbacks to run.
+    Returns {'ticks', 'seconds', 'rate' (ticks/sec), 'drain' (seconds
+    spent waiting on the order workers), 'stops' (triggered)}
+    """
+    records = isinstance(ticks, np.ndarray) and ticks.dtype.names and \
+        'ts' in ticks.dtype.names
+    if speed and not records:
+        logger.warning('Ticks have no receive time, replaying at full speed')
+        speed = None
+    triggered = sum(1 for o in polo.stopOrders.values() if 'triggered' in o)
+    n = 0
+    start = perf_counter()
+    first = None
+    for msg in ticks:
+        if speed:
+            if first is None:
+                first = float(msg['ts'])
+            # wait until this tick is due
+            due = start + (float(msg['ts']) - first) / speed
+            if due > perf_counter():
+                sleep(due - perf_counter())
+        polo.on_ticker(_tickRow(msg) if records else msg)
+        n += 1
+    fed = perf_counter()
+    # every order worker waiting on the barrier means the queue is empty
+    workers = polo.orderWorkers
+    barrier = Barrier(workers + 1)
+    for _ in range(workers):
+        polo._orderPool.submit(barrier.wait)
+    barrier.wait()
+    end = perf_counter()
+    took = end - start
+    return {'ticks': n, 'seconds': took,
+            'rate': n / took if took else 0.0, 'drain': end - fed,
+            'stops': sum(1 for o in polo.stopOrders.values()
+                         if 'triggered' in o) - triggered}
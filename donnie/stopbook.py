@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from bisect import bisect_left, bisect_right
+from itertools import count
+from threading import Lock
+
+from .tools import getLogger
+
+logger = getLogger(__name__)
+
+
+class StopBook(object):
+    """
+    Per market index of stop orders sorted by trigger price.
+    Sell stops trigger once the highestBid falls to (or below) their stop,
+    buy stops trigger once the lowestAsk rises to (or above) their stop.
+    Entrys are kept as sorted (stop, seq, id) tuples so checking a tick only
+    costs a bisect plus the stops that were actually crossed.
+    """
+
+    def __init__(self):
+        # market: {'sell': [(stop, seq, id), ...], 'buy': [...]}
+        self._markets = {}
+        # id: (market, side, entry)
+        self._index = {}
+        self._seq = count()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, id):
+        return id in self._index
+
+    def add(self, id, market, side, stop):
+        """ Adds stop <id> to <market> ('side' is 'buy' or 'sell') """
+        entry = (float(stop), next(self._seq), id)
+        with self._lock:
+            if id in self._index:
+                self._remove(id)
+            book = self._markets.setdefault(market, {'sell': [], 'buy': []})
+            stops = book[side]
+            stops.insert(bisect_left(stops, entry), entry)
+            self._index[id] = (market, side, entry)
+
+    def remove(self, id):
+        """ Removes stop <id>, returns False if it wasnt in the book """
+        with self._lock:
+            return self._remove(id)
+
+    def _remove(self, id):
+        if id not in self._index:
+            return False
+        market, side, entry = self._index.pop(id)
+        stops = self._markets[market][side]
+        del stops[bisect_left(stops, entry)]
+        return True
+
+    def triggered(self, market, lowAsk, highBid):
+        """
+        Pops and returns the ids of every stop in <market> crossed by
+        <lowAsk>/<highBid>
+        """
+        book = self._markets.get(market)
+        if not book:
+            return []
+        with self._lock:
+            sells, buys = book['sell'], book['buy']
+            # sell stops >= highBid
+            i = bisect_left(sells, (highBid,))
+            # buy stops <= lowAsk
+            j = bisect_right(buys, (lowAsk, float('inf')))
+            if i == len(sells) and not j:
+                return []
+            hits = sells[i:] + buys[:j]
+            del sells[i:]
+            del buys[:j]
+            for entry in hits:
+                del self._index[entry[2]]
+        return [entry[2] for entry in hits]
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from .tools import getLogger, np, pd
+
+logger = getLogger(__name__)
+
+# websocket ticker message layout
+TICKER_FIELDS = ('id', 'last', 'lowestAsk', 'highestBid', 'percentChange',
+                 'baseVolume', 'quoteVolume', 'isFrozen', 'high24hr',
+                 'low24hr')
+
+TICKER_DTYPE = np.dtype([(f, 'i8' if f in ('id', 'isFrozen') else 'f8')
+                         for f in TICKER_FIELDS])
+
+
+class TickerStore(object):
+    """
+    Live ticker data kept in one preallocated numpy structured array with a
+    row per market. Updates are written into the market's row in place,
+    'store[id]' returns a dict of the row like the old dict-of-dicts did.
+    """
+
+    def __init__(self, size=256):
+        self._array = np.zeros(size, dtype=TICKER_DTYPE)
+        # market id: row
+        self._rows = {}
+        # market name of each row
+        self.markets = []
+
+    def __len__(self):
+        return len(self.markets)
+
+    def __contains__(self, id):
+        return id in self._rows
+
+    def __getitem__(self, id):
+        return dict(zip(TICKER_FIELDS, self._array[self._rows[id]].tolist()))
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def add(self, market, data):
+        """ Adds <market> with its ticker <data> (dict or message list) """
+        if isinstance(data, dict):
+            data = [data[f] for f in TICKER_FIELDS]
+        data = [float(d) for d in data[:len(TICKER_FIELDS)]]
+        id = int(data[0])
+        if id not in self._rows:
+            if len(self.markets) == len(self._array):
+                self._array = np.resize(self._array, len(self._array) * 2)
+            self._rows[id] = len(self.markets)
+            self.markets.append(market)
+        self._array[self._rows[id]] = tuple(data)
+        return self._rows[id]
+
+    def update(self, msg):
+        """
+        Writes a websocket ticker message into its market row in place.
+        Returns the row, or None if the market id is unknown (use 'add'
+        for new markets)
+        """
+        row = self._rows.get(int(msg[0]))
+        if row is not None:
+            self._array[row] = tuple(msg[:len(TICKER_FIELDS)])
+        return row
+
+    def toDict(self):
+        """ Returns {id: {field: value}} for every market """
+        return {id: self[id] for id in self._rows}
+
+    @property
+    def array(self):
+        """ Zero-copy view of every market row """
+        return self._array[:len(self.markets)]
+
+    def frame(self):
+        """ Returns every market row in a dataframe indexed by market """
+        return pd.DataFrame(self.array, index=self.markets)
@@ -25,24 +25,70 @@
 import sys
 import logging
 import json
+import importlib.util
 from math import floor, ceil
 from math import pi as PI
 from time import time, gmtime, strftime, strptime, localtime, mktime, sleep
 from calendar import timegm
-from threading import Thread
+from threading import Thread, Lock
+from collections import deque
+from functools import lru_cache
 
-# 3rd party
-import numpy as np
-import pandas as pd
-import pymongo
-from finta import TA
-import tqdm
+
+def lazyImport(name):
+    """
+    Returns module <name> without running it, the module is only
+    executed when one of its attributes is first used
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError('No module named %r' % name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def loadModules(*modules):
+    """
+    Finishes loading lazy <modules> on the calling thread. 'LazyLoader'
+    isnt thread safe before python 3.12, call this before handing work
+    that uses them to a thread pool
+    """
+    for module in modules:
+        # any attribute access runs the module
+        module.__dict__
+
+
+# 3rd party (loaded on first use)
+np = lazyImport('numpy')
+pd = lazyImport('pandas')
+pymongo = lazyImport('pymongo')
+bson = lazyImport('bson')
+finta = lazyImport('finta')
+tqdm = lazyImport('tqdm')
 
 getLogger = logging.getLogger
 
 logger = getLogger(__name__)
 
-DB = pymongo.MongoClient()
+# settings for the shared mongo client, used when it is first needed
+MONGO = {'host': None, 'maxPoolSize': 100, 'connect': False}
+
+_client = None
+_clientLock = Lock()
+
+
+def __getattr__(name):
+    # old module attributes that are now created on first use
+    if name == 'DB':
+        return getMongoClient()
+    if name == 'TA':
+        return finta.TA
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 MINUTE, HOUR, DAY = 60, 60 * 60, 60 * 60 * 24
 WEEK, MONTH = DAY * 7, DAY * 30
@@ -53,6 +99,24 @@ PHI = (1 + 5 ** 0.5) / 2
 # smallest coin fraction
 SATOSHI = 0.00000001
 
+# candle data columns (besides '_id')
+CHART_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'quoteVolume',
+                 'weightedAverage')
+
+# how 'zoomOHLC' resamples each candle column
+ZOOM_AGG = {'_id': 'first', 'open': 'first', 'high': 'max', 'low': 'min',
+            'close': 'last', 'quoteVolume': 'sum', 'volume': 'sum',
+            'weightedAverage': 'mean'}
+
+# candle columns the 'finta.TA' indicators read
+OHLCV = ('open', 'high', 'low', 'close', 'volume')
+
+# oldest history synced from poloniex (2015-01-01)
+HISTORY_START = timegm((2015, 1, 1, 0, 0, 0, 0, 0, 0))
+
+# materialized candle rollups {period seconds: collection suffix}
+ROLLUPS = {MINUTE * 15: '15m', HOUR: '1h', HOUR * 4: '4h', DAY: '1d'}
+
 # console colors ---------------------------------------------------------
 WT = '\033[0m'  # white (normal)
 
@@ -130,75 +194,320 @@ def shuffleDataFrame(df):
 
 def addIndicators(df, **conf):
     """ Adds indicators to a ohlc df using 'finta.TA' """
-    avail = dir(TA)
+    avail = dir(finta.TA)
     for ind in conf:
         if ind in avail:
             df = pd.concat(
-                [getattr(TA, ind)(ohlc=df, **conf[ind]), df],
+                [getattr(finta.TA, ind)(ohlc=df, **conf[ind]), df],
                 axis=1
                 )
     return df
 
 def zoomOHLC(df, zoom):
-    """ Resamples a ohlc df """
+    """ Resamples a ohlc df (only the candle columns it has) """
     df.reset_index(inplace=True)
     df.set_index('date', inplace=True)
     df = df.resample(rule=zoom,
                      closed='left',
-                     label='left').apply({'_id': 'first',
-                                          'open': 'first',
-                                          'high': 'max',
-                                          'low': 'min',
-                                          'close': 'last',
-                                          'quoteVolume': 'sum',
-                                          'volume': 'sum',
-                                          'weightedAverage': 'mean'})
+                     label='left').apply({c: how for c, how in ZOOM_AGG.items()
+                                          if c in df.columns})
     df.reset_index(inplace=True)
     return df.set_index('_id')
 
-def getDatabase(db):
-    """ Returns a mongodb database """
-    return DB[db]
+class RateLimiter(object):
+    """ Thread safe limiter that allows <calls> every <per> seconds """
+
+    def __init__(self, calls=6, per=1.0):
+        self.calls = calls
+        self.per = per
+        self._stamps = deque()
+        self._lock = Lock()
+
+    def wait(self):
+        """ Blocks until a call is allowed """
+        while True:
+            with self._lock:
+                now = time()
+                while self._stamps and now - self._stamps[0] >= self.per:
+                    self._stamps.popleft()
+                if len(self._stamps) < self.calls:
+                    self._stamps.append(now)
+                    return
+                delay = self.per - (now - self._stamps[0])
+            sleep(delay)
+
+def planWindows(stop, end, size=MONTH * 3):
+    """
+    Splits the time between <stop> and <end> into (start, end) windows of
+    <size> seconds, newest window first
+    """
+    windows = []
+    while int(end) > int(stop):
+        start = max(end - size, stop)
+        windows.append((start, end))
+        end = start
+    return windows
+
+def getRollupName(zoom):
+    """
+    Returns the ROLLUPS suffix matching a pandas resample rule
+    ('15T', '1H', '4h', '1D'...) or None
+    """
+    try:
+        offset = pd.tseries.frequencies.to_offset(zoom)
+        return ROLLUPS.get(int(pd.Timedelta(offset).total_seconds()))
+    except (ValueError, TypeError):
+        return None
+
+def rollupChartData(base, roll, period, since=None):
+    """
+    Aggregates the 5min candles in collection <base> into <period> second
+    candles in collection <roll>. Only the candles from the last (still
+    open) rollup candle on, or from <since> if older, are recomputed.
+    Returns the 'bulkUpsert' results
+    """
+    last = getLastEntry(roll)
+    start = last['_id'] if last else None
+    if since is not None and (start is None or since < start):
+        start = since - since % period
+    query = {'_id': {'$gte': start}} if start is not None else {}
+    cols = loadColumns(base, query, CHART_COLUMNS,
+                       sort=[('_id', pymongo.ASCENDING)])
+    if not len(cols['_id']):
+        return []
+    df = pd.DataFrame(cols)
+    df['date'] = df['_id'] - df['_id'] % period
+    # same aggregation as 'zoomOHLC'
+    df = df.groupby('date').agg({'open': 'first',
+                                 'high': 'max',
+                                 'low': 'min',
+                                 'close': 'last',
+                                 'quoteVolume': 'sum',
+                                 'volume': 'sum',
+                                 'weightedAverage': 'mean'})
+    out = {'date': df.index.values.tolist()}
+    for col in df:
+        out[col] = df[col].values.tolist()
+    rows = [dict(zip(out, vals)) for vals in zip(*out.values())]
+    return updateChartData(roll, rows, progress=False)
+
+def setMongoClient(client=None, **settings):
+    """
+    Injects the shared mongo <client>, or updates the MONGO settings
+    (host, maxPoolSize, minPoolSize...) the lazy client is created with
+    """
+    global _client
+    with _clientLock:
+        MONGO.update(settings)
+        # None makes the next 'getMongoClient' create a new client
+        _client = client
+
+def getMongoClient():
+    """ Returns the shared mongo client, creating it on first use """
+    global _client
+    if _client is None:
+        with _clientLock:
+            if _client is None:
+                _client = pymongo.MongoClient(**MONGO)
+    return _client
+
+def getDatabase(db, client=None):
+    """ Returns a mongodb database (of <client> or the shared client) """
+    return (client or getMongoClient())[db]
 
 def getLastEntry(db, scol='_id'):
     """ Get the last entry of a collection """
     return db.find_one(sort=[(scol, pymongo.DESCENDING)])
 
-def updateChartData(db, data):
-    """ Upserts chart data into db with a tqdm wrapper. """
-    for i in tqdm.trange(len(data)):
-        db.update_one({'_id': data[i]['date']}, {
-                      "$set": data[i]}, upsert=True)
-
-def updateTradeHistData(db, data):
-    """ Upserts trade history data into db with a tqdm wrapper. """
-    for i in tqdm.trange(len(data)):
-        data[i]['date'] = UTCstr2epoch(data[i]['date'])
-        db.update_one({'_id': data[i]['globalTradeID']}, {
-                      "$set": data[i]}, upsert=True)
-
-def updateLendingHistData(db, data):
-    """ Upserts lendingHistory history data into db with a tqdm wrapper. """
-    for i in tqdm.trange(len(data)):
-        data[i]['close'] = UTCstr2epoch(data[i]['close'])
-        data[i]['open'] = UTCstr2epoch(data[i]['open'])
-        db.update_one({'_id': data[i]['id']}, {
-                      "$set": data[i]}, upsert=True)
-
-def getChartDataFrame(db, start, zoom=None, indica=None):
+def getFirstEntry(db, scol='_id'):
+    """ Get the first entry of a collection """
+    return db.find_one(sort=[(scol, pymongo.ASCENDING)])
+
+def findRuns(ids, step):
+    """
+    Returns the [start, end] ranges of the sorted <ids> where each id is
+    at most <step> after the previous one
+    """
+    ids = np.asarray(ids)
+    if not len(ids):
+        return []
+    breaks = np.flatnonzero(np.diff(ids) > step)
+    starts = np.r_[0, breaks + 1]
+    ends = np.r_[breaks, len(ids) - 1]
+    return [[int(ids[s]), int(ids[e])] for s, e in zip(starts, ends)]
+
+def mergeRanges(ranges):
+    """ Merges overlapping or touching [start, end] ranges """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def findGaps(ranges, start, end):
+    """
+    Returns the [start, end] parts of <start> - <end> that are not
+    covered by <ranges>
+    """
+    gaps = []
+    for s, e in mergeRanges(ranges):
+        if e <= start:
+            continue
+        if s >= end:
+            break
+        if s > start:
+            gaps.append([start, s])
+        start = e
+    if start < end:
+        gaps.append([start, end])
+    return gaps
+
+_coverageLock = Lock()
+
+def getCoverage(db, name):
+    """
+    Returns the fetched [start, end] ranges of collection <name> from the
+    'coverage' collection of database <db> or None if it isnt indexed yet
+    """
+    doc = db['coverage'].find_one({'_id': name})
+    return doc['ranges'] if doc else None
+
+def setCoverage(db, name, ranges):
+    """ Replaces the fetched ranges of collection <name> """
+    with _coverageLock:
+        ranges = mergeRanges([[int(s), int(e)] for s, e in ranges])
+        db['coverage'].update_one({'_id': name},
+                                  {'$set': {'ranges': ranges}}, upsert=True)
+    return ranges
+
+def addCoverage(db, name, start, end):
+    """ Marks <start> - <end> of collection <name> as fetched """
+    with _coverageLock:
+        ranges = mergeRanges((getCoverage(db, name) or []) +
+                             [[int(start), int(end)]])
+        db['coverage'].update_one({'_id': name},
+                                  {'$set': {'ranges': ranges}}, upsert=True)
+    return ranges
+
+def bulkUpsert(db, data, key, batch=1000, progress=True):
+    """
+    Upserts <data> into db using unordered 'bulk_write' batches of <batch>
+    'UpdateOne' operations, each row is matched by its <key> field.
+    Returns a list of per-batch {'inserted': int, 'modified': int} counts
+    """
+    results = []
+    if not data:
+        return results
+    bar = tqdm.tqdm(total=len(data)) if progress else None
+    for i in range(0, len(data), batch):
+        chunk = data[i:i + batch]
+        res = db.bulk_write(
+            [pymongo.UpdateOne({'_id': row[key]}, {"$set": row},
+                               upsert=True)
+             for row in chunk],
+            ordered=False)
+        results.append({'inserted': res.upserted_count,
+                        'modified': res.modified_count})
+        if bar:
+            bar.update(len(chunk))
+    if bar:
+        bar.close()
+    return results
+
+def updateChartData(db, data, batch=1000, progress=True):
+    """ Upserts chart data into db in bulk batches. """
+    return bulkUpsert(db, data, 'date', batch, progress)
+
+def updateTradeHistData(db, data, batch=1000, progress=True):
+    """ Upserts trade history data into db in bulk batches. """
+    dates = UTCstrs2epochs([row['date'] for row in data])
+    for row, date in zip(data, dates):
+        row['date'] = date
+    return bulkUpsert(db, data, 'globalTradeID', batch, progress)
+
+def updateLendingHistData(db, data, batch=1000, progress=True):
+    """ Upserts lendingHistory history data into db in bulk batches. """
+    closes = UTCstrs2epochs([row['close'] for row in data])
+    opens = UTCstrs2epochs([row['open'] for row in data])
+    for row, close, open_ in zip(data, closes, opens):
+        row['close'] = close
+        row['open'] = open_
+    return bulkUpsert(db, data, 'id', batch, progress)
+
+def loadColumns(db, query=None, fields=CHART_COLUMNS, dtype='f8',
+                sort=None, batch=10000):
+    """
+    Streams the docs matching <query> from collection <db> in raw BSON
+    batches and decodes only <fields> into preallocated numpy columns, so
+    memory grows with the requested columns instead of whole docs.
+    dtype = numpy dtype for every field or a {field: dtype} dict
+            ('_id' is int64 unless given)
+    Returns a dict of {field: array}, always including '_id'
+    """
+    query = query or {}
+    fields = ['_id'] + [f for f in fields if f != '_id']
+    dtypes = {}
+    for f in fields:
+        if isinstance(dtype, dict):
+            dtypes[f] = np.dtype(dtype.get(f, 'i8' if f == '_id' else 'f8'))
+        else:
+            dtypes[f] = np.dtype('i8' if f == '_id' else dtype)
+    # value used for missing fields
+    fills = {f: np.nan if dtypes[f].kind == 'f' else
+             0 if dtypes[f].kind in 'iub' else None for f in fields}
+    size = db.count_documents(query)
+    out = {f: np.empty(size, dtype=dtypes[f]) for f in fields}
+    cursor = db.find_raw_batches(query, dict.fromkeys(fields, True),
+                                 batch_size=batch)
+    if sort:
+        cursor = cursor.sort(sort)
+    i = 0
+    for raw in cursor:
+        docs = bson.decode_all(raw)
+        # ignore docs inserted after we counted
+        n = min(len(docs), size - i)
+        for f in fields:
+            fill = fills[f]
+            out[f][i:i + n] = [d.get(f, fill) for d in docs[:n]]
+        i += n
+        if i == size:
+            break
+    return {f: out[f][:i] for f in fields}
+
+def getChartDataFrame(db, start, zoom=None, indica=None, cache=None,
+                      fields=CHART_COLUMNS, dtype='f8'):
     """
     Gets the last collection entrys starting from 'start' and puts them in a df
+    cache = optional 'cache.ChartCache' to read the candles from instead
+    fields = candle columns to load, dtype = their numpy dtype
+    indica = 'addIndicators' config or an 'IncrementalIndicators' engine
+             (the ohlcv columns are always loaded for it)
     """
+    if indica:
+        fields = tuple(fields) + tuple(c for c in OHLCV if c not in fields)
     try:
-        df = pd.DataFrame(list(db.find({"_id": {"$gt": start}})))
-        # set date column to datetime
-        df['date'] = pd.to_datetime(df["_id"], unit='s')
-        df.set_index('_id', inplace=True)
+        if cache:
+            # pull new candles into the cache and read the slice from disk
+            cache.sync(db)
+            df = cache.frame(db.name, start, columns=fields)
+            if np.dtype(dtype) != np.float64:
+                df = df.astype({c: dtype for c in df if c != 'date'})
+        else:
+            df = pd.DataFrame(loadColumns(db, {"_id": {"$gt": start}},
+                                          fields, dtype,
+                                          sort=[('_id', pymongo.ASCENDING)]))
+            # set date column to datetime
+            df['date'] = pd.to_datetime(df["_id"], unit='s')
+            df.set_index('_id', inplace=True)
         # adjust candle period 'zoom'
         if zoom:
             df = zoomOHLC(df, zoom)
         # add TA indicators
-        if indica:
+        if hasattr(indica, 'update') and not isinstance(indica, dict):
+            df = indica.update(df)
+        elif indica:
             df = addIndicators(df, **indica)
         return df
     except Exception as e:
@@ -231,6 +540,35 @@ def UTCstr2epoch(datestr=False, fmat="%Y-%m-%d %H:%M:%S"):
     return timegm(strptime(datestr, fmat))
 
 
+@lru_cache(maxsize=4096)
+def _dayEpoch(day):
+    """ Epoch of a UTC '%Y-%m-%d' day (memoized) """
+    return timegm(strptime(day, "%Y-%m-%d"))
+
+
+def UTCstrs2epochs(datestrs, fmat="%Y-%m-%d %H:%M:%S"):
+    """
+    - takes a sequence of UTC date strings
+    - returns a list of epochs (same as 'UTCstr2epoch' on each string)
+    The default format is parsed with a memoized date prefix so only the
+    time of day is parsed per string, anything else falls back to
+    'UTCstr2epoch'
+    """
+    if fmat != "%Y-%m-%d %H:%M:%S":
+        return [UTCstr2epoch(d, fmat) for d in datestrs]
+    out = []
+    for d in datestrs:
+        h, m, sec = d[11:13], d[14:16], d[17:19]
+        if (len(d) == 19 and d[10] == ' ' and d[13] == d[16] == ':' and
+                h.isdigit() and m.isdigit() and sec.isdigit() and
+                int(h) < 24 and int(m) < 60 and int(sec) < 62):
+            out.append(_dayEpoch(d[:10]) +
+                       int(h) * 3600 + int(m) * 60 + int(sec))
+        else:
+            out.append(UTCstr2epoch(d, fmat))
+    return out
+
+
 def epoch2localstr(timestamp=False, fmat="%Y-%m-%d %H:%M:%S"):
     """
     - takes epoch timestamp
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#    BTC: 13MXa7EdMYaXaQK6cDHqd4dwr2stBK3ESE
+#    LTC: LfxwJHNCjDh2qyJdfu22rBFi2Eu8BjQdxj
+#
+#    https://github.com/s4w3d0ff/donnie
+#
+#    Copyright (C) 2018  https://github.com/s4w3d0ff
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.metrics import accuracy_score
+
+from .tools import getLogger, np, pd, prepDataframe
+from .brain import Brain
+
+logger = getLogger(__name__)
+
+
+def walkForwardFolds(size, train, test, step=None, anchored=False):
+    """
+    Plans rolling-origin folds over <size> rows as
+    (trainStart, trainEnd, testEnd) row positions
+    train = rows to train on, test = rows to score after them
+    step = rows the origin moves each fold (defaults to <test>)
+    anchored = keep training from row 0 (expanding window)
+    """
+    step = step or test
+    folds = []
+    end = train
+    while end + test <= size:
+        folds.append((0 if anchored else end - train, end, end + test))
+        end += step
+    return folds
+
+
+def _runFold(job):
+    """ Trains and scores one fold in a worker process """
+    pair, name, lobes, fold, xpath, ypath, i = job
+    # memory-mapped, nothing but the paths was pickled
+    x = np.load(xpath, mmap_mode='r')
+    y = np.load(ypath, mmap_mode='r')
+    start, end, stop = fold
+    brain = Brain(lobes)
+    # one process per fold already uses every core
+    brain.lobe.n_jobs = 1
+    brain.lobe.fit(np.asarray(x[start:end]), np.asarray(y[start:end]))
+    pred = brain.lobe.predict(np.asarray(x[end:stop]))
+    return {'pair': pair, 'lobes': name, 'fold': i, 'trainStart': start,
+            'trainEnd': end, 'testEnd': stop,
+            'accuracy': accuracy_score(y[end:stop], pred)}
+
+
+def walkForward(frames, lobes=None, train=5000, test=500, step=None,
+                anchored=False, workers=None, location=None):
+    """
+    Walk-forward evaluation of many pairs and lobe configs at once on a
+    process pool. Feature matrices are saved once as .npy files and
+    memory-mapped by the workers instead of being pickled to them.
+    frames = {pair: dataframe of features + 'label'}
+    lobes = {config name: lobes dict for 'Brain'} (defaults to Brain's)
+    train/test/step/anchored = see 'walkForwardFolds'
+    workers = number of processes (defaults to the number of cores)
+    location = folder for the temporary feature files
+    Returns a dataframe of every fold's accuracy and a dataframe of the
+    mean accuracy per fold (rows) and lobe config (columns)
+    """
+    lobes = lobes or {'default': False}
+    workers = workers or os.cpu_count()
+    tmp = tempfile.mkdtemp(prefix='donnie-wf-', dir=location)
+    try:
+        jobs = []
+        for pair, df in frames.items():
+            df = prepDataframe(df)
+            xpath = os.path.join(tmp, pair + '-x.npy')
+            ypath = os.path.join(tmp, pair + '-y.npy')
+            np.save(xpath, df.drop('label', axis=1).values.astype(float))
+            # labels as int codes so they can be memory-mapped too
+            np.save(ypath, pd.factorize(df['label'])[0])
+            folds = walkForwardFolds(len(df), train, test, step, anchored)
+            for i, fold in enumerate(folds):
+                for name in lobes:
+                    jobs.append((pair, name, lobes[name], fold,
+                                 xpath, ypath, i))
+        logger.info('Running %d walk-forward folds on %d workers',
+                    len(jobs), workers)
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_runFold, jobs))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    results = pd.DataFrame(results, columns=['pair', 'lobes', 'fold',
+                                             'trainStart', 'trainEnd',
+                                             'testEnd', 'accuracy'])
+    summary = results.pivot_table(index='fold', columns='lobes',
+                                  values='accuracy', aggfunc='mean')
+    return results, summary
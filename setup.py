@@ -34,11 +34,15 @@ setup(name='donnie',
       author='s4w3d0ff',
       license='GPL v3',
       packages=['donnie'],
+      # module __getattr__ (PEP 562) for the lazy exports
+      python_requires='>=3.7',
       install_requires=['scikit-learn',
                         'pandas',
                         'pymongo',
                         'poloniexapi',
-                        'finta',
+                        # TA functions take 'ohlc=', the incremental column
+                        # names match this version
+                        'finta==1.0',
                         'tqdm',
                         'joblib'],
       zip_safe=False,
@@ -0,0 +1,20 @@
+import numpy as np
+
+from donnie.backtest import simulateStops
+
+
+def test_simulate_stops():
+    bid = np.array([1.0, 0.99, 0.95, 0.97, 0.98])
+    out = simulateStops(bid, bid + 0.01, -1, np.array([0.96, 0.9]),
+                        np.array([0.97, 0.89]))
+    assert out['triggered'].tolist() == [True, False]
+    assert out['triggerTime'].tolist()[0] == 2
+    assert out['fillTime'].tolist()[0] == 3
+    assert out['filled'].tolist() == [True, False]
+
+
+def test_simulate_stops_no_prices():
+    out = simulateStops([], [], -1, [0.96, 0.9], [0.95, 0.89])
+    assert out.empty
+    assert list(out.columns) == ['stop', 'limit', 'triggered', 'filled',
+                                 'triggerTime', 'fillTime', 'fillPrice']
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from donnie.brain import Brain, incrementalLobes
+
+
+def makeRows(size, seed):
+    rs = np.random.RandomState(seed)
+    df = pd.DataFrame(rs.normal(0, 1, (size, 4)) * [1, 1000, 0.001, 50] +
+                      [0, 5000, 0, -20], columns=list('abcd'))
+    df['label'] = (df['a'] + rs.normal(0, 0.5, size) > 0).astype(int)
+    return df
+
+
+def test_learn_keeps_the_train_scaling():
+    brain = Brain(incrementalLobes(), window=500)
+    brain.train(makeRows(2000, 1), preprocess=True)
+    # the window holds scaled rows
+    assert np.allclose(brain._window[0].mean(axis=0), 0, atol=0.2)
+    new = makeRows(200, 2)
+    brain.learn(new)
+    assert np.abs(brain._window[0]).max() < 10
+    x = new.drop('label', axis=1)
+    assert (brain.predictRows(x.values) == brain.predict(x)).all()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from donnie import poloapi
+from donnie.cache import ChartCache
+from donnie.replay import LocalExchange
+
+
+def makePoloniex(monkeypatch, loads, last=None):
+    """ Offline Poloniex whose chart reads are counted in <loads> """
+    frame = pd.DataFrame({'close': [1.0, 2.0, 3.0]}, index=[300, 600, 900])
+    last = last if last is not None else {'_id': 900, 'close': 3.0,
+                                          'volume': 1.0}
+
+    def load(*args, **kwargs):
+        loads.append(args)
+        return frame.copy()
+
+    monkeypatch.setattr(poloapi, 'getChartDataFrame', load)
+    monkeypatch.setattr(poloapi, 'getLastEntry',
+                        lambda db, scol='_id': dict(last))
+    polo = poloapi.Poloniex(exchange=LocalExchange({}), chartCache=False)
+    monkeypatch.setattr(polo, 'syncChartData', lambda pair: 0)
+    return polo
+
+
+def test_result_cache_hit(monkeypatch):
+    loads = []
+    polo = makePoloniex(monkeypatch, loads)
+    # an empty cache must still be used
+    assert len(polo.resultCache) == 0
+    first = polo.chartDataFrame('BTC_ETH', zoom='2H')
+    second = polo.chartDataFrame('BTC_ETH', zoom='2H')
+    assert len(loads) == 1
+    assert polo.resultCache.stats['misses'] == 1
+    assert polo.resultCache.stats['hits'] == 1
+    assert len(polo.resultCache) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_result_cache_open_candle(monkeypatch):
+    loads = []
+    last = {'_id': 900, 'close': 3.0, 'volume': 1.0}
+    polo = makePoloniex(monkeypatch, loads, last)
+    polo.chartDataFrame('BTC_ETH', zoom='2H')
+    # the open candle was updated under the same '_id'
+    last['close'] = 3.5
+    polo.chartDataFrame('BTC_ETH', zoom='2H')
+    assert len(loads) == 2
+    # the incremental path doesnt share entries with the full one
+    polo.chartDataFrame('BTC_ETH', zoom='2H', incremental=True)
+    assert len(loads) == 3
+    assert polo.resultCache.stats['hits'] == 0
+
+
+def test_chart_cache_frame_is_a_copy(tmpdir):
+    cache = ChartCache(str(tmpdir))
+    ids = np.arange(300, 300 * 11, 300)
+    cache.append('X', {'_id': ids, 'close': ids * 1.0})
+    df = cache.frame('X')
+    assert not np.shares_memory(df.index.values, cache.ids('X'))
+    cache.truncate('X', ids[5])
+    cache.append('X', {'_id': ids[5:] + 1, 'close': ids[5:] * 2.0})
+    assert (df.index.values == ids).all()
+    assert (df['close'].values == ids).all()
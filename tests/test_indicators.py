@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from donnie.tools import addIndicators
+from donnie.indicators import IncrementalIndicators
+
+CONF = {'EMA': {'period': 9}, 'SMA': {'period': 20}, 'RSI': {'period': 14},
+        'MACD': {}, 'BBANDS': {'period': 20}}
+
+
+def makeChart(size=300, seed=666):
+    rs = np.random.RandomState(seed)
+    close = 0.01 * np.exp(np.cumsum(rs.normal(0, 0.01, size)))
+    ids = np.arange(size) * 300 + 1500000000
+    df = pd.DataFrame({'open': np.r_[close[0], close[:-1]],
+                       'high': close * 1.01, 'low': close * 0.99,
+                       'close': close, 'volume': rs.uniform(1, 10, size)},
+                      index=pd.Index(ids, name='_id'))
+    df['date'] = pd.to_datetime(df.index, unit='s')
+    return df
+
+
+def assertMatches(inc, full):
+    assert list(inc.columns) == list(full.columns)
+    for col in full:
+        if np.issubdtype(full[col].dtype, np.number):
+            assert np.allclose(inc[col].values, full[col].values,
+                               rtol=1e-9, equal_nan=True), col
+
+
+def test_growing_frames():
+    chart = makeChart()
+    inc = IncrementalIndicators(**CONF)
+    for end in (10, 30, 31, 32, 100, 101, 250, 300):
+        df = chart.iloc[:end]
+        assertMatches(inc.update(df), addIndicators(df, **CONF))
+
+
+def test_changed_open_candle():
+    chart = makeChart()
+    inc = IncrementalIndicators(**CONF)
+    inc.update(chart.iloc[:200])
+    # the last candle was still open and has changed since
+    for move in (1.02, 0.97):
+        df = chart.iloc[:200].copy()
+        df.iloc[-1, df.columns.get_loc('close')] *= move
+        assertMatches(inc.update(df), addIndicators(df, **CONF))
+    # then closes and new candles arrive
+    df = chart.iloc[:220]
+    assertMatches(inc.update(df), addIndicators(df, **CONF))
+
+
+def test_verify():
+    assert IncrementalIndicators(**CONF).verify(makeChart())
+
+
+def test_chart_frame_incremental_matches_full(monkeypatch):
+    from donnie import poloapi
+    from donnie.replay import LocalExchange
+    chart = makeChart()
+    window = [0, 200]
+
+    def load(db, start, zoom=None, indica=None, **kwargs):
+        # the sliding 'time() - frame' read, with the real indica handling
+        df = chart.iloc[window[0]:window[1]].copy()
+        if hasattr(indica, 'update') and not isinstance(indica, dict):
+            return indica.update(df)
+        return addIndicators(df, **indica)
+
+    monkeypatch.setattr(poloapi, 'getChartDataFrame', load)
+    polo = poloapi.Poloniex(exchange=LocalExchange({}), chartCache=False,
+                            resultCache=False)
+    monkeypatch.setattr(polo, 'syncChartData', lambda pair: 0)
+    # same frame, grown frame, then a window that slid forward
+    for window[:] in ([0, 200], [0, 201], [1, 202], [5, 230]):
+        inc = polo.chartDataFrame('BTC_ETH', indica=CONF, incremental=True)
+        full = polo.chartDataFrame('BTC_ETH', indica=CONF)
+        assertMatches(inc, full)
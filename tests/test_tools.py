@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from donnie.tools import zoomOHLC, findRuns, findGaps
+
+
+def makeCandles(columns, size=48):
+    # starts on a 2H boundary
+    ids = np.arange(size) * 300 + 1499997600
+    df = pd.DataFrame({c: np.arange(size, dtype='f8') for c in columns},
+                      index=pd.Index(ids, name='_id'))
+    df['date'] = pd.to_datetime(df.index, unit='s')
+    return df
+
+
+def test_zoom_only_loaded_columns():
+    df = zoomOHLC(makeCandles(('close', 'volume')), '2H')
+    assert sorted(df.columns) == ['close', 'date', 'volume']
+    assert len(df) == 2
+    assert df['close'].tolist() == [23.0, 47.0]
+    assert df['volume'].tolist() == [sum(range(24)), sum(range(24, 48))]
+
+
+def test_find_runs():
+    ids = [300, 600, 900, 1800, 2100, 3000]
+    assert findRuns(ids, 300) == [[300, 900], [1800, 2100], [3000, 3000]]
+    assert findRuns([], 300) == []
+    # the holes between the runs are what gets backfilled
+    assert findGaps(findRuns(ids, 300), 0, 3600) == [
+        [0, 300], [900, 1800], [2100, 3000], [3000, 3600]]